@@ -1,14 +1,13 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime, timedelta
+import io
 import time
-import plotly.graph_objects as go
-import plotly.express as px
-from sqlalchemy import desc, asc, or_
 
 # Import custom modules
-from database import init_database, get_session, CustomerMessage, CannedResponse, CustomerProfile
-import utils
+from database import init_database
+import fragments
+from repository import MESSAGE_STATUSES, QUEUE_SORTS, UNRESOLVED, MessageRepository, QueueFilter
+from routing import DEFAULT_AGENTS, Router
 
 # Page configuration
 st.set_page_config(
@@ -118,8 +117,8 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize session state
-if 'selected_message' not in st.session_state:
-    st.session_state.selected_message = None
+if 'selected_message_id' not in st.session_state:
+    st.session_state.selected_message_id = None
 if 'agent_name' not in st.session_state:
     st.session_state.agent_name = "Agent_01"
 if 'auto_refresh' not in st.session_state:
@@ -127,88 +126,246 @@ if 'auto_refresh' not in st.session_state:
 if 'last_refresh' not in st.session_state:
     st.session_state.last_refresh = datetime.now()
 
-def init_session():
-    """Initialize database and session"""
-    if 'db_initialized' not in st.session_state:
-        init_database()
-        st.session_state.db_initialized = True
+@st.cache_resource
+def get_repository():
+    """Bootstrap the database once and get the repository shared by every session in this process"""
+    init_database()
+    from shared_cache import SharedCache
+    # Query results are shared with the other app processes on this host
+    return MessageRepository(shared_cache=SharedCache())
 
-def get_customer_profile(user_id):
-    """Get customer profile information"""
-    session = get_session()
-    try:
-        profile = session.query(CustomerProfile).filter(CustomerProfile.user_id == user_id).first()
-        return profile
-    finally:
-        session.close()
+@st.cache_resource
+def get_router():
+    """Get the assignment engine shared by every session in this process"""
+    return Router(get_repository())
 
-def get_canned_responses():
-    """Get all canned responses"""
-    session = get_session()
-    try:
-        responses = session.query(CannedResponse).order_by(CannedResponse.use_count.desc()).all()
-        return responses
-    finally:
-        session.close()
+@st.cache_resource
+def get_recommender():
+    """Get the template recommender shared by every session in this process"""
+    from recommender import TemplateRecommender
+    return TemplateRecommender()
 
-def update_message_status(message_id, status, agent_name=None, response_text=None):
-    """Update message status and add response"""
-    session = get_session()
-    try:
-        message = session.query(CustomerMessage).filter(CustomerMessage.id == message_id).first()
-        if message:
-            message.status = status
-            if agent_name:
-                message.agent_id = agent_name
-            if response_text:
-                message.response = response_text
-                message.response_timestamp = datetime.now()
-            session.commit()
-            return True
-    finally:
-        session.close()
-    return False
+@st.cache_resource
+def get_queue_engine():
+    """Get the in-memory queue snapshot shared by every session in this process"""
+    from queue_engine import QueueSnapshot
+    return QueueSnapshot(get_repository())
 
-def add_new_canned_response(title, response_text, category):
-    """Add new canned response"""
-    session = get_session()
-    try:
-        response = CannedResponse(
-            title=title,
-            response_text=response_text,
-            category=category
-        )
-        session.add(response)
-        session.commit()
-        return True
-    finally:
-        session.close()
-    return False
+@st.cache_resource
+def get_delivery_service():
+    """Start the outbound delivery workers once per process; None when no gateway is configured"""
+    from delivery import DeliveryDispatcher, DeliveryService, load_gateway
+    gateway = load_gateway()
+    if gateway is None:
+        return None
+    return DeliveryService(DeliveryDispatcher(get_repository(), gateway)).start()
 
-def get_message_stats():
-    """Get message statistics"""
-    session = get_session()
-    try:
-        total = session.query(CustomerMessage).count()
-        pending = session.query(CustomerMessage).filter(CustomerMessage.status == 'pending').count()
-        high_priority = session.query(CustomerMessage).filter(CustomerMessage.priority == 'high').count()
-        today = datetime.now().date()
-        today_messages = session.query(CustomerMessage).filter(
-            CustomerMessage.timestamp >= datetime.combine(today, datetime.min.time())
-        ).count()
-        
-        return {
-            'total': total,
-            'pending': pending,
-            'high_priority': high_priority,
-            'today': today_messages
+def notify_delivery():
+    """Wake the delivery workers after queueing responses"""
+    service = get_delivery_service()
+    if service is not None:
+        service.notify()
+
+@st.cache_resource
+def get_maintenance():
+    """Start the database maintenance scheduler once per process"""
+    from maintenance import MaintenanceScheduler
+    # Processes share the schedule through the database, so each task runs once per interval overall
+    return MaintenanceScheduler(get_repository().engine).start()
+
+@st.cache_resource
+def get_fragment_cache():
+    """Get the HTML fragment cache shared by every session in this process"""
+    return fragments.FragmentCache()
+
+@st.cache_resource(max_entries=32)
+def build_urgency_gauge(value):
+    """Build the urgency gauge once per (clamped) score and share it; plotly is imported on first use"""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number",
+        value = value,
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        title = {'text': "Urgency Score"},
+        gauge = {
+            'axis': {'range': [0, 20]},
+            'bar': {'color': "darkblue"},
+            'steps': [
+                {'range': [0, 7], 'color': "lightgreen"},
+                {'range': [7, 14], 'color': "yellow"},
+                {'range': [14, 20], 'color': "red"}
+            ],
+            'threshold': {
+                'line': {'color': "black", 'width': 4},
+                'thickness': 0.75,
+                'value': 10
+            }
         }
-    finally:
-        session.close()
+    ))
+    fig.update_layout(height=200, margin=dict(l=10, r=10, t=30, b=10))
+    return fig
+
+DELIVERY_LABELS = {
+    "queued": "⏳ Queued for delivery",
+    "sending": "📤 Sending",
+    "delivered": "✓ Delivered",
+    "failed": "⚠️ Delivery failed",
+}
+
+SORT_LABELS = {
+    "urgency": "Most urgent message",
+    "customer_backlog": "Customers with most open messages",
+    "customer_urgency": "Customer's highest urgency",
+    "customer_recent": "Most recently active customers",
+}
+
+def delivery_caption(delivery, service):
+    """One-line delivery status for the latest response"""
+    caption = DELIVERY_LABELS.get(delivery.status, delivery.status)
+    if service is not None and service.dispatcher.gateway.simulated and delivery.status != "queued":
+        caption += " (simulated)"
+    if service is None and delivery.status == "queued":
+        caption += " · no delivery gateway configured"
+    elif delivery.status == "delivered":
+        caption += f" · {fragments.relative_time(delivery.delivered_at)}"
+    elif delivery.last_error:
+        caption += f" · attempt {delivery.attempts}: {delivery.last_error}"
+    return caption
+
+def change_message_status(message_id, status_key):
+    """Status selectbox callback"""
+    status = st.session_state[status_key]
+    if get_repository().update_message_status(message_id, status, st.session_state.agent_name):
+        if status == "resolved":
+            get_router().release(message_id)
+        st.toast(f"Status updated to {status}")
+
+BULK_ACTIONS = {
+    "Resolve": "resolved",
+    "Mark in progress": "in_progress",
+    "Mark pending": "pending",
+    "Respond & resolve": "resolved",
+    "Assign to agent": None,
+}
+
+def render_bulk_actions(repository, router, queue_filter):
+    """Apply one action to the ticked messages or to everything matching the filters"""
+    selected_ids = [
+        int(key[len("bulk_select_"):]) for key, ticked in st.session_state.items()
+        if key.startswith("bulk_select_") and ticked
+    ]
+    
+    with st.expander(f"Bulk actions ({len(selected_ids)} selected)"):
+        notice = st.session_state.pop("bulk_notice", None)
+        if notice:
+            st.info(notice)
+        target = st.radio("Apply to", ["Selected messages", "All messages matching filters"], key="bulk_target")
+        action = st.selectbox("Action", list(BULK_ACTIONS), key="bulk_action")
+        
+        response_text = None
+        template_id = None
+        assignee = None
+        if action == "Respond & resolve":
+            canned_responses = repository.get_canned_responses()
+            canned = st.selectbox("Quick Response", [None] + list(canned_responses),
+                                  format_func=lambda cr: "" if cr is None else cr.title, key="bulk_canned")
+            template_id = canned.id if canned else None
+            response_text = st.text_area("Response", value=canned.response_text if canned else "", key="bulk_response")
+        elif action == "Assign to agent":
+            assignee = st.selectbox("Agent", [agent.agent_id for agent in DEFAULT_AGENTS], key="bulk_assignee")
+        
+        if st.button("Apply", type="primary", use_container_width=True, key="bulk_apply"):
+            if target == "Selected messages" and not selected_ids:
+                st.warning("Tick at least one message")
+                return
+            if action == "Respond & resolve" and not (response_text or "").strip():
+                st.warning("Please enter a response")
+                return
+            
+            status = BULK_ACTIONS[action]
+            if status is None:
+                ids = selected_ids if target == "Selected messages" else repository.get_message_ids(queue_filter)
+                router.assign_many(ids, assignee)
+            else:
+                if target == "Selected messages":
+                    result = repository.bulk_update_status(selected_ids, status, st.session_state.agent_name,
+                                                           response_text, template_id=template_id)
+                else:
+                    result = repository.bulk_update_filtered(queue_filter, status, st.session_state.agent_name,
+                                                             response_text, template_id=template_id)
+                if status == "resolved":
+                    router.release_many(result.updated)
+                if response_text:
+                    notify_delivery()
+                if result.skipped:
+                    # Shown after the rerun below
+                    st.session_state.bulk_notice = (f"Updated {len(result.updated)} messages; skipped "
+                                                    f"{result.skipped} already resolved or answered")
+            
+            for message_id in selected_ids:
+                del st.session_state[f"bulk_select_{message_id}"]
+            st.rerun()
+
+def render_export(repository, queue_filter):
+    """Download what matches the filters, up to UI_EXPORT_MAX_ROWS; larger slices go to the CLI"""
+    import export
+
+    with st.expander("📤 Export"):
+        fmt = st.radio("Format", export.EXPORT_FORMATS, horizontal=True, key="export_format")
+        file_name = f"messages_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+        count = repository.count_messages(queue_filter)
+        if count > export.UI_EXPORT_MAX_ROWS:
+            st.warning(f"{count:,} messages match; downloads here are limited to "
+                       f"{export.UI_EXPORT_MAX_ROWS:,}. Export from the command line instead:")
+            st.code(export.command_line(queue_filter, file_name), language="bash")
+            return
+
+        def build_export():
+            # Streamlit reads the whole download into memory, hence the row limit above
+            buffer = io.BytesIO()
+            export.export_messages(repository, queue_filter, buffer, fmt)
+            return buffer.getvalue()
+
+        st.download_button(
+            f"Download {count:,} matching messages",
+            data=build_export,
+            file_name=file_name,
+            mime=export.MIME_TYPES[fmt],
+            use_container_width=True,
+            key="export_download"
+        )
+
+def render_database_health(maintenance):
+    """Database size, free pages, WAL and page cache, plus the last maintenance runs"""
+    from maintenance import format_bytes
+    with st.expander("🛠 Database"):
+        stats, last_runs = maintenance.health()
+        st.caption(
+            f"Size: {format_bytes(stats['file_bytes'])} · WAL: {format_bytes(stats['wal_bytes'])} · "
+            f"Free pages: {stats['freelist_count']} ({stats['free_ratio']:.1%}) · "
+            f"Page cache: {format_bytes(stats['page_cache_bytes'])}/connection"
+        )
+        now = time.time()
+        for task, (last_run, duration, detail) in sorted(last_runs.items()):
+            if last_run:
+                st.caption(f"{task}: {(now - last_run) / 60:.0f} min ago, {(duration or 0) * 1000:.0f} ms · {detail or 'running'}")
+            else:
+                st.caption(f"{task}: not run yet")
 
 def main():
     """Main application function"""
-    init_session()
+    repository = get_repository()
+    router = get_router()
+    router.sync()
+    recommender = get_recommender()
+    recommender.sync(repository.get_canned_responses())
+    queue_engine = get_queue_engine()
+    queue_engine.refresh()
+    get_delivery_service()
+    maintenance = get_maintenance()
+    maintenance.record_activity()
+    fragment_cache = get_fragment_cache()
     
     # Header
     col1, col2, col3 = st.columns([2, 3, 1])
@@ -223,7 +380,7 @@ def main():
             st.rerun()
     
     # Get statistics
-    stats = get_message_stats()
+    stats = repository.get_message_stats()
     
     # Metrics row
     col1, col2, col3, col4 = st.columns(4)
@@ -231,28 +388,28 @@ def main():
         st.markdown(f"""
         <div class='metric-card'>
             <h4 style='color: #666; margin: 0;'>Total Messages</h4>
-            <h2 style='color: #0d6efd; margin: 10px 0;'>{stats['total']}</h2>
+            <h2 style='color: #0d6efd; margin: 10px 0;'>{stats.total}</h2>
         </div>
         """, unsafe_allow_html=True)
     with col2:
         st.markdown(f"""
         <div class='metric-card'>
             <h4 style='color: #666; margin: 0;'>Pending</h4>
-            <h2 style='color: #FF9800; margin: 10px 0;'>{stats['pending']}</h2>
+            <h2 style='color: #FF9800; margin: 10px 0;'>{stats.pending}</h2>
         </div>
         """, unsafe_allow_html=True)
     with col3:
         st.markdown(f"""
         <div class='metric-card'>
             <h4 style='color: #666; margin: 0;'>High Priority</h4>
-            <h2 style='color: #FF4B4B; margin: 10px 0;'>{stats['high_priority']}</h2>
+            <h2 style='color: #FF4B4B; margin: 10px 0;'>{stats.high_priority}</h2>
         </div>
         """, unsafe_allow_html=True)
     with col4:
         st.markdown(f"""
         <div class='metric-card'>
             <h4 style='color: #666; margin: 0;'>Today</h4>
-            <h2 style='color: #4CAF50; margin: 10px 0;'>{stats['today']}</h2>
+            <h2 style='color: #4CAF50; margin: 10px 0;'>{stats.today}</h2>
         </div>
         """, unsafe_allow_html=True)
     
@@ -263,6 +420,15 @@ def main():
     with col_left:
         st.subheader("📨 Message Queue")
         
+        queue_view = st.radio("View", ["My queue", "All messages"], horizontal=True, key="queue_view")
+        if queue_view == "My queue":
+            if st.button("Get next message", use_container_width=True):
+                next_id = router.pull_next(st.session_state.agent_name)
+                if next_id is not None:
+                    st.session_state.selected_message_id = next_id
+                    st.rerun()
+                st.info("No waiting messages match your skills")
+        
         # Filters
         with st.expander("Filters", expanded=True):
             search_query = st.text_input("Search messages", key="search_filter")
@@ -287,152 +453,151 @@ def main():
                  "account", "urgent", "fraud", "general", "other"],
                 key="category_filter"
             )
+            received = st.date_input("Received between", value=(), key="date_filter")
+            since = datetime.combine(received[0], datetime.min.time()) if received else None
+            until = datetime.combine(received[-1], datetime.min.time()) + timedelta(days=1) if received else None
+            sort = st.selectbox("Sort by", QUEUE_SORTS, format_func=SORT_LABELS.get, key="queue_sort")
+            group_clusters = st.checkbox("Group similar messages", key="group_clusters")
         
         # Get filtered messages
-        session = get_session()
-        try:
-            query = session.query(CustomerMessage).order_by(desc(CustomerMessage.urgency_score), desc(CustomerMessage.timestamp))
-            
-            if priority_filter != "all":
-                query = query.filter(CustomerMessage.priority == priority_filter)
-            if status_filter != "all":
-                query = query.filter(CustomerMessage.status == status_filter)
-            if category_filter != "all":
-                query = query.filter(CustomerMessage.category == category_filter)
-            
-            if search_query:
-                query = query.filter(
-                    or_(
-                        CustomerMessage.message_body.contains(search_query),
-                        CustomerMessage.user_id.cast(String).contains(search_query)
-                    )
-                )
-            
-            messages = query.limit(50).all()
-        finally:
-            session.close()
+        if queue_view == "My queue":
+            queue_filter = QueueFilter(
+                search_query=search_query,
+                priority=priority_filter,
+                status=UNRESOLVED if status_filter == "all" else status_filter,
+                category=category_filter,
+                agent_id=st.session_state.agent_name,
+                group_clusters=group_clusters,
+                since=since,
+                until=until,
+                sort=sort
+            )
+        else:
+            queue_filter = QueueFilter(
+                search_query=search_query,
+                priority=priority_filter,
+                status=status_filter,
+                category=category_filter,
+                group_clusters=group_clusters,
+                since=since,
+                until=until,
+                sort=sort
+            )
+        if queue_engine.covers(queue_filter):
+            messages = queue_engine.query(queue_filter)
+        else:
+            messages = repository.get_queue_page(queue_filter)
+        # Rank templates for the whole page in one pass; the chat panel then hits the memo
+        recommender.recommend_batch(messages)
         
         # Display message list
         st.markdown("<div class='scrollable'>", unsafe_allow_html=True)
         for msg in messages:
-            priority_color = utils.get_priority_color(msg.priority)
-            status_color = utils.get_status_color(msg.status)
-            time_ago = utils.format_timestamp(msg.timestamp)
-            
-            is_selected = st.session_state.selected_message and st.session_state.selected_message.id == msg.id
-            
-            st.markdown(f"""
-            <div class='message-item {'selected' if is_selected else ''}' onclick='selectMessage({msg.id})'>
-                <div style='display: flex; justify-content: space-between; align-items: center;'>
-                    <strong>Customer {msg.user_id}</strong>
-                    <small style='color: #666;'>{time_ago}</small>
-                </div>
-                <div style='margin: 8px 0; font-size: 0.9em; color: #444;'>
-                    {msg.message_body[:60]}...
-                </div>
-                <div style='display: flex; gap: 4px;'>
-                    <span class='priority-badge' style='background-color: {priority_color}; color: white;'>
-                        {msg.priority.upper()}
-                    </span>
-                    <span class='status-badge' style='background-color: {status_color}; color: white;'>
-                        {msg.status.replace('_', ' ').upper()}
-                    </span>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            is_selected = st.session_state.selected_message_id == msg.id
+            st.markdown(fragments.queue_item(fragment_cache, msg, is_selected), unsafe_allow_html=True)
             
             # Add selection functionality
-            if st.button(f"Select", key=f"select_{msg.id}", use_container_width=True):
-                st.session_state.selected_message = msg
-                st.rerun()
+            col_s1, col_s2 = st.columns([1, 3])
+            with col_s1:
+                st.checkbox("Bulk", key=f"bulk_select_{msg.id}")
+            with col_s2:
+                if st.button(f"Select", key=f"select_{msg.id}", use_container_width=True):
+                    st.session_state.selected_message_id = msg.id
+                    st.rerun()
         
         st.markdown("</div>", unsafe_allow_html=True)
+        
+        render_bulk_actions(repository, router, queue_filter)
+        render_export(repository, queue_filter)
     
     # Center column: Chat interface
     with col_center:
         st.subheader("💬 Chat")
         
-        if st.session_state.selected_message:
-            msg = st.session_state.selected_message
-            
+        msg = None
+        if st.session_state.selected_message_id is not None:
+            msg = repository.get_thread(st.session_state.selected_message_id)
+        
+        if msg:
             # Customer info header
             col_c1, col_c2 = st.columns([3, 1])
             with col_c1:
                 st.markdown(f"### Customer {msg.user_id}")
             with col_c2:
-                # Status update
-                current_status = st.selectbox(
+                # Status update; keyed on the stored status so a change made
+                # elsewhere (e.g. Send Response) resets the widget
+                status_key = f"status_update_{msg.id}_{msg.status}"
+                st.selectbox(
                     "Update Status",
-                    ["pending", "in_progress", "resolved"],
-                    index=["pending", "in_progress", "resolved"].index(msg.status),
-                    key=f"status_update_{msg.id}"
+                    MESSAGE_STATUSES,
+                    index=MESSAGE_STATUSES.index(msg.status),
+                    key=status_key,
+                    on_change=change_message_status,
+                    args=(msg.id, status_key)
                 )
-                if current_status != msg.status:
-                    if update_message_status(msg.id, current_status, st.session_state.agent_name):
-                        msg.status = current_status
-                        st.success(f"Status updated to {current_status}")
-                        time.sleep(0.5)
-                        st.rerun()
             
             # Chat history
             chat_container = st.container()
             with chat_container:
                 # Customer message
-                st.markdown(f"""
-                <div class='customer-message'>
-                    <div style='font-weight: bold; margin-bottom: 4px;'>Customer {msg.user_id}</div>
-                    <div>{msg.message_body}</div>
-                    <div style='font-size: 0.8em; color: #666; margin-top: 8px;'>
-                        {utils.format_timestamp(msg.timestamp)}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(fragments.customer_bubble(fragment_cache, msg), unsafe_allow_html=True)
                 
                 # Agent response if exists
                 if msg.response:
-                    st.markdown(f"""
-                    <div class='agent-message'>
-                        <div style='font-weight: bold; margin-bottom: 4px;'>{msg.agent_id or 'Agent'}</div>
-                        <div>{msg.response}</div>
-                        <div style='font-size: 0.8em; color: rgba(255,255,255,0.8); margin-top: 8px;'>
-                            {utils.format_timestamp(msg.response_timestamp)}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+                    st.markdown(fragments.agent_bubble(fragment_cache, msg), unsafe_allow_html=True)
+                    deliveries = repository.get_deliveries(msg.id)
+                    if deliveries:
+                        st.caption(delivery_caption(deliveries[-1], get_delivery_service()))
             
             # Response input
             st.markdown("---")
             
-            # Canned responses
-            canned_responses = get_canned_responses()
-            canned_titles = [cr.title for cr in canned_responses]
-            selected_canned = st.selectbox("Quick Responses", [""] + canned_titles)
+            # Canned responses: recommended templates first, then the rest by use count
+            canned_responses = repository.get_canned_responses()
+            suggested = [cr for cr, _ in recommender.recommend(msg)]
+            suggested_ids = {cr.id for cr in suggested}
+            ordered = suggested + [cr for cr in canned_responses if cr.id not in suggested_ids]
+            selected_response = st.selectbox(
+                "Quick Responses",
+                [None] + ordered,
+                format_func=lambda cr: "" if cr is None else ("⭐ " if cr.id in suggested_ids else "") + cr.title,
+                key=f"quick_response_{msg.id}"
+            )
             
-            if selected_canned:
-                selected_response = next((cr for cr in canned_responses if cr.title == selected_canned), None)
-                if selected_response:
-                    response_text = st.text_area("Response", value=selected_response.response_text, height=100)
-                else:
-                    response_text = st.text_area("Response", height=100)
+            if selected_response:
+                response_text = st.text_area("Response", value=selected_response.response_text, height=100)
             else:
                 response_text = st.text_area("Response", height=100)
             
+            # Near-duplicates of this message that are still open
+            similar = []
+            if msg.cluster_id is not None:
+                similar = [m for m in repository.get_cluster_members(msg.cluster_id) if m.id != msg.id]
+            answer_cluster = False
+            if similar:
+                answer_cluster = st.checkbox(
+                    f"Also send to {len(similar)} similar open message{'s' if len(similar) > 1 else ''}",
+                    key=f"answer_cluster_{msg.id}"
+                )
+            
             col_r1, col_r2 = st.columns([4, 1])
             with col_r1:
                 if st.button("Send Response", type="primary", use_container_width=True):
                     if response_text.strip():
-                        if update_message_status(msg.id, "resolved", st.session_state.agent_name, response_text):
-                            # Update canned response use count
-                            if selected_canned:
-                                session = get_session()
-                                try:
-                                    cr = session.query(CannedResponse).filter(CannedResponse.title == selected_canned).first()
-                                    if cr:
-                                        cr.use_count += 1
-                                        session.commit()
-                                finally:
-                                    session.close()
-                            
+                        # Canned response use count is bumped in the same transaction
+                        template_id = selected_response.id if selected_response else None
+                        if answer_cluster:
+                            result = repository.bulk_update_status(
+                                [msg.id] + [m.id for m in similar], "resolved", st.session_state.agent_name,
+                                response_text, template_id=template_id
+                            )
+                            router.release_many(result.updated)
+                            notify_delivery()
+                            st.rerun()
+                        if repository.update_message_status(msg.id, "resolved", st.session_state.agent_name,
+                                                            response_text, template_id=template_id):
+                            router.release(msg.id)
+                            notify_delivery()
                             st.success("Response sent!")
                             time.sleep(0.5)
                             st.rerun()
@@ -441,7 +606,7 @@ def main():
             
             with col_r2:
                 if st.button("Mark as Pending", use_container_width=True):
-                    update_message_status(msg.id, "pending", st.session_state.agent_name)
+                    repository.update_message_status(msg.id, "pending", st.session_state.agent_name)
                     st.success("Marked as pending")
                     time.sleep(0.5)
                     st.rerun()
@@ -452,35 +617,22 @@ def main():
     with col_right:
         st.subheader("👤 Customer Profile")
         
-        if st.session_state.selected_message:
-            msg = st.session_state.selected_message
-            profile = get_customer_profile(msg.user_id)
+        if msg:
+            profile = repository.get_customer_profile(msg.user_id)
             
             if profile:
                 # Customer info
-                st.markdown(f"""
-                <div class='metric-card'>
-                    <h4 style='margin: 0 0 10px 0;'>Customer Information</h4>
-                    <p><strong>Name:</strong> {profile.name}</p>
-                    <p><strong>Phone:</strong> {profile.phone}</p>
-                    <p><strong>Email:</strong> {profile.email or 'N/A'}</p>
-                    <p><strong>Credit Score:</strong> <span style='color: {'#4CAF50' if profile.credit_score >= 700 else '#FF9800' if profile.credit_score >= 600 else '#FF4B4B'}'>
-                        {profile.credit_score}
-                    </span></p>
-                    <p><strong>Repayment History:</strong> <span style='color: {'#4CAF50' if profile.repayment_history == 'good' else '#FF9800' if profile.repayment_history == 'fair' else '#FF4B4B'}'>
-                        {profile.repayment_history.upper()}
-                    </span></p>
-                    <p><strong>Total Loans:</strong> {profile.total_loans}</p>
-                    <p><strong>Total Repaid:</strong> Ksh {profile.total_repaid:,}</p>
-                    <p><strong>Last Loan:</strong> Ksh {profile.last_loan_amount:,}</p>
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(fragments.profile_card(fragment_cache, profile), unsafe_allow_html=True)
             else:
                 st.warning("No profile found for this customer")
             
+            customer_stats = repository.get_customer_stats(msg.user_id)
+            if customer_stats:
+                st.markdown(fragments.customer_activity_card(fragment_cache, customer_stats), unsafe_allow_html=True)
+            
             # Message analysis
             st.markdown("### 📊 Message Analysis")
-            info = utils.extract_customer_info(msg.message_body)
+            info, score, category = fragments.message_analysis(fragment_cache, msg)
             
             if info:
                 st.markdown("**Extracted Information:**")
@@ -492,32 +644,10 @@ def main():
                     st.write(f"📅 Dates: {', '.join(info['dates'])}")
             
             # Urgency score visualization
-            score, priority = utils.calculate_urgency_score(msg.message_body)
-            fig = go.Figure(go.Indicator(
-                mode = "gauge+number",
-                value = min(score, 20),
-                domain = {'x': [0, 1], 'y': [0, 1]},
-                title = {'text': "Urgency Score"},
-                gauge = {
-                    'axis': {'range': [0, 20]},
-                    'bar': {'color': "darkblue"},
-                    'steps': [
-                        {'range': [0, 7], 'color': "lightgreen"},
-                        {'range': [7, 14], 'color': "yellow"},
-                        {'range': [14, 20], 'color': "red"}
-                    ],
-                    'threshold': {
-                        'line': {'color': "black", 'width': 4},
-                        'thickness': 0.75,
-                        'value': 10
-                    }
-                }
-            ))
-            fig.update_layout(height=200, margin=dict(l=10, r=10, t=30, b=10))
+            fig = build_urgency_gauge(min(score, 20))
             st.plotly_chart(fig, use_container_width=True)
             
             # Message category
-            category = utils.categorize_message(msg.message_body)
             st.markdown(f"**Category:** {category.replace('_', ' ').title()}")
             
         # Canned response management
@@ -533,7 +663,9 @@ def main():
             
             if st.button("Add Response", type="primary"):
                 if new_title and new_response:
-                    if add_new_canned_response(new_title, new_response, new_category):
+                    template = repository.add_canned_response(new_title, new_response, new_category)
+                    if template:
+                        recommender.add_template(template)
                         st.success("Canned response added!")
                         time.sleep(0.5)
                         st.rerun()
@@ -543,14 +675,24 @@ def main():
         # Agent selector
         st.markdown("---")
         st.subheader("👥 Agent Settings")
+        agent_ids = [agent.agent_id for agent in DEFAULT_AGENTS]
         agent_name = st.selectbox(
             "Select Agent",
-            ["Agent_01", "Agent_02", "Agent_03", "Agent_04", "Agent_05"],
-            index=0 if st.session_state.agent_name == "Agent_01" else 
-                  1 if st.session_state.agent_name == "Agent_02" else
-                  2 if st.session_state.agent_name == "Agent_03" else
-                  3 if st.session_state.agent_name == "Agent_04" else 4
+            agent_ids,
+            index=agent_ids.index(st.session_state.agent_name) if st.session_state.agent_name in agent_ids else 0
+        )
+        agent = router.engine.agents[agent_name]
+        st.caption(
+            f"Skills: {', '.join(sorted(agent.skills)) or 'all categories'} · "
+            f"Load: {router.engine.load(agent_name)}/{agent.capacity} · "
+            f"Waiting in queue: {router.engine.queue_depth()}"
+        )
+        cache_stats = repository.read_model.stats()
+        st.caption(
+            f"Cache hit ratio: {cache_stats['hit_ratio']:.0%} "
+            f"(this process {cache_stats['local_hit_ratio']:.0%}, shared {cache_stats['shared_hits']} hits)"
         )
+        render_database_health(maintenance)
         if agent_name != st.session_state.agent_name:
             st.session_state.agent_name = agent_name
             st.rerun()
@@ -0,0 +1,70 @@
+"""Near-duplicate clustering cost as the corpus grows.
+
+Ingests synthetic traffic (dataset messages with random word-level edits)
+through MessageRepository.ingest_messages in fixed-size waves, and prints the
+per-message ingest cost for each wave. Flat numbers mean clustering stays
+linear in corpus size. Run from the repository root:
+
+    python benchmarks/clustering.py
+"""
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def mutate(rng, body):
+    words = body.split()
+    if len(words) > 3 and rng.random() < 0.7:
+        del words[rng.randrange(len(words))]
+    if rng.random() < 0.5:
+        words.append(rng.choice(["pls", "plz", "asap", "today", "thanks", "kindly"]))
+    if rng.random() < 0.3:
+        words.insert(0, rng.choice(["Hi", "Hello", "Dear Branch"]))
+    return " ".join(words)
+
+
+def main(waves=5, wave_size=2000, seed=3):
+    with open(os.path.join(ROOT, "data", "GeneralistRails_Project_MessageData.csv"), newline="", encoding="utf-8") as f:
+        bodies = [row["Message Body"] for row in csv.DictReader(f)]
+
+    workdir = tempfile.mkdtemp(prefix="cs_clusters_")
+    try:
+        import database
+        database.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        database.Base.metadata.create_all(database.get_engine())
+        from repository import MessageRepository
+        repository = MessageRepository()
+
+        rng = random.Random(seed)
+        start_time = datetime(2024, 1, 1)
+        for wave in range(waves):
+            batch = [
+                (rng.randrange(1, 5000), start_time + timedelta(seconds=wave * wave_size + i),
+                 mutate(rng, rng.choice(bodies)))
+                for i in range(wave_size)
+            ]
+            started = time.perf_counter()
+            repository.ingest_messages(batch)
+            elapsed = time.perf_counter() - started
+            print(f"corpus {wave * wave_size:6d} -> {(wave + 1) * wave_size:6d}: "
+                  f"{elapsed / wave_size * 1000:.3f} ms/message")
+
+        with database.get_engine().connect() as conn:
+            clusters = conn.exec_driver_sql(
+                "SELECT COUNT(DISTINCT cluster_id), COUNT(*) FROM customer_messages"
+            ).one()
+        print(f"{clusters[1]} messages in {clusters[0]} clusters")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
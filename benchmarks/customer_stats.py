@@ -0,0 +1,113 @@
+"""Per-customer aggregates: customer_stats lookup vs on-demand scans, and trigger cost.
+
+Ingests synthetic traffic into a scratch database at growing sizes, then times
+the profile panel's customer aggregates read from customer_stats by primary
+key (raw, and through the repository's ORM loader) against the same figures
+computed by scanning customer_messages for the user, with and without the
+user_id index. Also prints ingest throughput with the customer_stats
+triggers in place and with them dropped, and the time of a queue page sorted
+by each customer signal, uncached from SQLite and from QueueSnapshot. Run
+from the repository root:
+
+    python benchmarks/customer_stats.py
+"""
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCAN = (
+    "SELECT COUNT(*), SUM(status IS NOT 'resolved'), SUM(status IS 'pending'), SUM(status IS 'in_progress'), "
+    "SUM(status IS 'resolved'), SUM(urgency_score), MAX(urgency_score), MIN(timestamp), MAX(timestamp) "
+    "FROM customer_messages {hint} WHERE user_id = ?"
+)
+
+
+def timed(func, repeats=200):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def rows(rng, count, users, start):
+    categories = ["loan_application", "payment", "clearance", "account_update", "fraud", "other"]
+    return [{
+        "user_id": rng.randrange(users),
+        "timestamp": start + timedelta(seconds=i),
+        "message_body": f"Customer message {i}",
+        "urgency_score": rng.randrange(20),
+        "priority": rng.choice(["low", "normal", "high"]),
+        "category": rng.choice(categories),
+        "status": rng.choice(["pending", "in_progress", "resolved"]),
+    } for i in range(count)]
+
+
+def main(sizes=(10000, 100000, 400000), users=5000, seed=3):
+    workdir = tempfile.mkdtemp(prefix="cs_customer_stats_")
+    try:
+        import database
+        from database import CustomerMessage
+        from queue_engine import QueueSnapshot
+        from repository import CUSTOMER_SORT_COLUMNS, MessageRepository, QueueFilter
+        from sqlalchemy import insert
+
+        database.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        engine = database.get_engine()
+        database.bootstrap_schema(engine)
+        repository = MessageRepository(engine)
+        rng = random.Random(seed)
+        start = datetime(2024, 1, 1)
+
+        loaded = 0
+        for size in sizes:
+            batch = rows(rng, size - loaded, users, start + timedelta(seconds=loaded))
+            began = time.perf_counter()
+            with engine.begin() as conn:
+                conn.execute(insert(CustomerMessage), batch)
+            with_triggers = len(batch) / (time.perf_counter() - began)
+            loaded = size
+
+            probe = rows(rng, 5000, users, start - timedelta(days=1))
+            with engine.begin() as conn:
+                for name in ("insert", "update", "delete"):
+                    conn.exec_driver_sql(f"DROP TRIGGER trg_customer_stats_{name}")
+                began = time.perf_counter()
+                conn.execute(insert(CustomerMessage), probe)
+                without_triggers = len(probe) / (time.perf_counter() - began)
+                conn.rollback()
+            with engine.begin() as conn:
+                database.create_customer_stats_triggers(conn)
+
+            user_ids = [rng.choice(batch)["user_id"] for _ in range(200)]
+            picks = iter(user_ids * 10)
+            with engine.connect() as conn:
+                primary_key = timed(lambda: conn.exec_driver_sql(
+                    "SELECT * FROM customer_stats WHERE user_id = ?", (next(picks),)).one())
+                loader = timed(lambda: repository._load_customer_stats(next(picks)))
+                indexed = timed(lambda: conn.exec_driver_sql(SCAN.format(hint=""), (next(picks),)).one())
+                scan = timed(lambda: conn.exec_driver_sql(SCAN.format(hint="NOT INDEXED"), (next(picks),)).one(), 20)
+            print(f"{size:7d} messages: customer_stats {primary_key:6.3f} ms (ORM {loader:6.3f} ms)  "
+                  f"indexed scan {indexed:6.3f} ms  full scan {scan:7.2f} ms")
+            print(f"    ingest {with_triggers:8.0f} rows/s ({without_triggers:8.0f} without triggers)")
+            snapshot = QueueSnapshot(repository)
+            for sort in CUSTOMER_SORT_COLUMNS:
+                queue_filter = QueueFilter(status="unresolved", sort=sort)
+                sql = timed(lambda: repository._load_queue_page(queue_filter), 5)
+                memory = timed(lambda: snapshot.query(queue_filter), 20)
+                print(f"    queue page by {sort:17s} sqlite {sql:7.2f} ms  snapshot {memory:6.2f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Outbound delivery throughput and latency against the mock gateway.
+
+Queues a burst of responses through MessageRepository.bulk_update_status
+(the same transaction that writes the outbox), then drains it with
+DeliveryDispatcher pools of different sizes and batch sizes. The gateway
+takes 20 ms per call plus 0.5 ms per message and fails 2% of sends
+transiently. Prints delivered messages per second and the queued-to-delivered
+latency percentiles. Run from the repository root:
+
+    python benchmarks/delivery.py
+"""
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+async def drain(repository, dispatcher):
+    stop = asyncio.Event()
+    task = asyncio.create_task(dispatcher.run(stop))
+    while True:
+        await asyncio.sleep(0.01)
+        counts = await asyncio.to_thread(repository._load_outbox_counts)
+        if counts["queued"] == 0 and counts["sending"] == 0:
+            break
+    stop.set()
+    await task
+
+
+def main(messages=2000, seed=7):
+    workdir = tempfile.mkdtemp(prefix="cs_delivery_")
+    try:
+        import database
+        database.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        database.bootstrap_schema(database.get_engine())
+        from database import OutboundMessage
+        from delivery import DeliveryDispatcher, MockGateway
+        from repository import MessageRepository
+        from sqlalchemy import select
+        repository = MessageRepository()
+
+        for workers, batch_size in ((1, 1), (1, 50), (4, 10), (4, 50), (8, 50)):
+            # Fresh messages each round: answered ones are skipped by bulk responses
+            message_ids = repository.ingest_messages([
+                (i, datetime(2024, 1, 1) + timedelta(seconds=i), f"Customer message {i}") for i in range(messages)
+            ])
+            text = f"Reply from {workers} workers x {batch_size}"
+            repository.bulk_update_status(message_ids, "resolved", "Agent_01", text)
+            gateway = MockGateway(latency=0.02, per_message_latency=0.0005, failure_rate=0.02, seed=seed)
+            dispatcher = DeliveryDispatcher(repository, gateway, workers=workers, batch_size=batch_size,
+                                            base_backoff=0.05, max_backoff=0.5, poll_interval=0.01)
+            started = time.perf_counter()
+            asyncio.run(drain(repository, dispatcher))
+            elapsed = time.perf_counter() - started
+
+            with repository.engine.connect() as conn:
+                rows = conn.execute(
+                    select(OutboundMessage.created_at, OutboundMessage.delivered_at)
+                    .where(OutboundMessage.body == text, OutboundMessage.status == "delivered")
+                ).all()
+            latencies = sorted((delivered - created).total_seconds() * 1000 for created, delivered in rows)
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{workers} workers x batch {batch_size:2d}: {len(rows) / elapsed:7.0f} msg/s  "
+                  f"latency p50 {statistics.median(latencies):7.0f} ms  p95 {p95:7.0f} ms  "
+                  f"gateway calls {gateway.calls:4d}  retries {dispatcher.retried}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
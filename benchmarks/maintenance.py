@@ -0,0 +1,107 @@
+"""Database growth and queue latency over simulated months, with and without maintenance.
+
+Each simulated day ingests a batch of new messages, resolves a batch of
+older ones with a response (queueing outbox rows), and archives (deletes)
+messages older than the retention window, so the live set stays constant
+while change_log, free pages and statistics drift. One database runs the
+MaintenanceScheduler once a day on a simulated clock, the other never does.
+Prints file and WAL size, free pages, change_log entries and the median
+uncached queue-page latency as the days go by, then the time each
+maintenance task took on the last day. Run from the repository root:
+
+    python benchmarks/maintenance.py
+"""
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def timed(func, repeats=20):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def simulate(path, days, per_day, live_days, maintain, seed):
+    import database
+    from database import CustomerMessage
+    from maintenance import MaintenanceScheduler, database_stats, format_bytes
+    from repository import MessageRepository, QueueFilter
+    from sqlalchemy import delete, insert, select
+
+    database._engine = None
+    database.DATABASE_URL = f"sqlite:///{path}"
+    engine = database.get_engine()
+    database.bootstrap_schema(engine)
+    repository = MessageRepository(engine)
+    rng = random.Random(seed)
+    clock = [0.0]
+    scheduler = MaintenanceScheduler(engine, clock=lambda: clock[0])
+    categories = ["loan_application", "payment", "clearance", "account_update", "fraud", "other"]
+    start = datetime(2024, 1, 1)
+    last = []
+
+    for day in range(days + 1):
+        now = start + timedelta(days=day)
+        with engine.begin() as conn:
+            conn.execute(insert(CustomerMessage), [{
+                "user_id": rng.randrange(5000),
+                "timestamp": now + timedelta(seconds=i * 86400 / per_day),
+                "message_body": f"Customer message {day}-{i} about my {rng.choice(categories)}",
+                "urgency_score": rng.randrange(20),
+                "priority": rng.choice(["low", "normal", "high"]),
+                "category": rng.choice(categories),
+                "status": "pending",
+            } for i in range(per_day)])
+            pending = conn.execute(
+                select(CustomerMessage.id).where(CustomerMessage.status == "pending",
+                                                 CustomerMessage.timestamp < now)
+            ).scalars().all()
+            conn.execute(delete(CustomerMessage).where(CustomerMessage.timestamp < now - timedelta(days=live_days)))
+        repository.bulk_update_status(rng.sample(pending, min(len(pending), per_day)), "resolved",
+                                      "Agent_01", f"Resolved on day {day}")
+
+        if maintain:
+            clock[0] = day * 86400.0
+            last = scheduler.run_pending()
+
+        if day % 15 == 0:
+            repository.read_model.invalidate()
+            latency = timed(lambda: repository._load_queue_page(QueueFilter(status="unresolved", category="payment")))
+            stats = database_stats(engine)
+            print(f"  day {day:3d}: file {format_bytes(stats['file_bytes']):>9s}  wal {format_bytes(stats['wal_bytes']):>9s}  "
+                  f"free pages {stats['freelist_count']:6d}  change_log {stats['change_log_entries']:7d}  "
+                  f"queue page {latency:6.2f} ms")
+    engine.dispose()
+    return last
+
+
+def main(days=90, per_day=2000, live_days=7, seed=5):
+    import maintenance
+    # Scaled to the simulation: keep about two days of change history
+    maintenance.CHANGE_LOG_RETENTION = 4 * per_day
+    workdir = tempfile.mkdtemp(prefix="cs_maintenance_")
+    try:
+        for maintain in (False, True):
+            print("with maintenance" if maintain else "without maintenance")
+            path = os.path.join(workdir, f"bench_{int(maintain)}.db")
+            last = simulate(path, days, per_day, live_days, maintain, seed)
+            for name, seconds, detail in last:
+                print(f"  {name:26s} {seconds * 1000:7.1f} ms  {detail}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Queue filter latency: in-memory columnar snapshot vs SQLite.
+
+Ingests synthetic traffic into a scratch database at growing sizes, most of
+it resolved history like a real install, then times the snapshot load (open
+messages only), the same sidebar filters answered by QueueSnapshot.query and
+by an uncached MessageRepository queue-page query, plus the cost of a
+refresh that replays a burst of status changes. Run from the repository root:
+
+    python benchmarks/queue_engine.py
+"""
+import csv
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# Share of each ingested batch resolved straight away, standing in for months of history
+RESOLVED_SHARE = 0.9
+
+
+def timed(func, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main(sizes=(1000, 10000, 50000), seed=11):
+    with open(os.path.join(ROOT, "data", "GeneralistRails_Project_MessageData.csv"), newline="", encoding="utf-8") as f:
+        bodies = [row["Message Body"] for row in csv.DictReader(f)]
+
+    workdir = tempfile.mkdtemp(prefix="cs_queue_")
+    try:
+        import database
+        database.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        database.bootstrap_schema(database.get_engine(), from_version=database.SCHEMA_VERSION)
+        from queue_engine import QueueSnapshot
+        from repository import UNRESOLVED, MessageRepository, QueueFilter
+        repository = MessageRepository()
+
+        filters = {
+            "unresolved": QueueFilter(status=UNRESOLVED),
+            "high + loan": QueueFilter(status=UNRESOLVED, priority="high", category="loan_application"),
+            "search 'crb'": QueueFilter(status=UNRESOLVED, search_query="crb"),
+            "grouped": QueueFilter(status=UNRESOLVED, group_clusters=True),
+        }
+
+        rng = random.Random(seed)
+        start_time = datetime(2024, 1, 1)
+        loaded = 0
+        for size in sizes:
+            new_ids = repository.ingest_messages([
+                (rng.randrange(1, 5000), start_time + timedelta(seconds=i), rng.choice(bodies))
+                for i in range(loaded, size)
+            ])
+            loaded = size
+            repository.bulk_update_status(rng.sample(new_ids, int(len(new_ids) * RESOLVED_SHARE)), "resolved")
+
+            started = time.perf_counter()
+            snapshot = QueueSnapshot(repository)
+            load_ms = (time.perf_counter() - started) * 1000
+            print(f"{size} messages, {len(snapshot)} open (snapshot load {load_ms:.0f} ms)")
+            for name, queue_filter in filters.items():
+                memory = timed(lambda: snapshot.query(queue_filter), 50)
+                sqlite = timed(lambda: repository._load_queue_page(queue_filter), 10)
+                print(f"  {name:14s} snapshot {memory:7.3f} ms   sqlite {sqlite:8.3f} ms")
+
+            ids = repository.get_message_ids(QueueFilter(status=UNRESOLVED, limit=100))
+            repository.bulk_update_status(ids, "resolved", agent_name="Agent_01", response_text="done")
+            print(f"  refresh after 100 updates {timed(snapshot.refresh, 1):.3f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Latency of the canned-response recommender.
+
+Builds indexes of growing size from synthetic templates (dataset vocabulary
+recombined, plus a few template-specific terms such as product names and
+reference codes, so the vocabulary grows with the library the way it does in
+practice), then times single-message ranking, a 50-message queue-page batch
+and an incremental add of a template that brings new terms. Also reports the
+vocabulary size and index memory. Run from the repository root:
+
+    python benchmarks/recommender.py
+"""
+import csv
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import utils  # noqa: E402
+from recommender import TemplateRecommender  # noqa: E402
+from repository import MessageRecord, TemplateRecord  # noqa: E402
+
+
+def load_messages():
+    path = os.path.join(ROOT, "data", "GeneralistRails_Project_MessageData.csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        bodies = [row["Message Body"] for row in csv.DictReader(f)]
+    return [
+        MessageRecord(id=i, user_id=0, timestamp=datetime(2024, 1, 1), message_body=body,
+                      agent_id=None, response=None, response_timestamp=None, status="pending",
+                      urgency_score=0, priority="low", category=utils.categorize_message(body))
+        for i, body in enumerate(bodies)
+    ]
+
+
+# Terms only one template uses, e.g. product names and reference codes
+UNIQUE_TERMS = 6
+
+
+def synthetic_templates(messages, count, rng, first_id=0):
+    words = [w for m in messages for w in m.message_body.split()]
+    categories = sorted({m.category for m in messages})
+    return [
+        TemplateRecord(id=i, title=" ".join(rng.sample(words, 3)),
+                       response_text=" ".join(rng.sample(words, 25) + [f"ref{i}x{j}" for j in range(UNIQUE_TERMS)]),
+                       category=rng.choice(categories), use_count=rng.randrange(100))
+        for i in range(first_id, first_id + count)
+    ]
+
+
+def index_bytes(recommender):
+    return sum(value.nbytes for value in vars(recommender).values() if hasattr(value, "nbytes"))
+
+
+def timed(func, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    rng = random.Random(5)
+    messages = load_messages()
+    page = messages[:50]
+    for count in (10, 100, 1000, 5000, 20000):
+        templates = synthetic_templates(messages, count, rng)
+        build = timed(lambda: TemplateRecommender(templates), 3)
+        recommender = TemplateRecommender(templates)
+
+        def single():
+            recommender._ranked.clear()
+            recommender.recommend(rng.choice(messages))
+
+        def batch():
+            recommender._ranked.clear()
+            recommender.recommend_batch(page)
+
+        extras = iter(synthetic_templates(messages, 5, rng, first_id=count))
+        add_ms = timed(lambda: recommender.add_template(next(extras)), 5)
+        print(f"{count:5d} templates: vocabulary {len(recommender._vocab):6d}  "
+              f"index {index_bytes(recommender) / 1024:8.1f} KiB  build {build:8.2f} ms  "
+              f"single {timed(single, 200):6.3f} ms  page of 50 {timed(batch, 50):6.3f} ms  "
+              f"incremental add {add_ms:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
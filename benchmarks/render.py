@@ -0,0 +1,88 @@
+"""Server-side render cost of one rerun's HTML.
+
+Builds the queue page (50 rows), both chat bubbles and the profile card for
+the seeded dataset, first with an empty fragment cache (every fragment is
+built, as before the cache existed) and then warm (only relative times are
+joined in). Also times building an urgency gauge figure, which the app now
+does once per score value instead of once per rerun. Run from the repository
+root:
+
+    python benchmarks/render.py
+"""
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def timed(func, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="cs_render_")
+    cwd = os.getcwd()
+    try:
+        os.chdir(ROOT)
+        import database
+        database.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        database.init_database()
+        import fragments
+        from repository import MessageRepository, QueueFilter
+        repository = MessageRepository()
+
+        messages = repository.get_queue_page(QueueFilter(status="all", limit=50))
+        selected = messages[0]
+        profile = repository.get_customer_profile(selected.user_id)
+        cache = fragments.FragmentCache()
+
+        def rerun():
+            for msg in messages:
+                fragments.queue_item(cache, msg, msg.id == selected.id)
+            fragments.customer_bubble(cache, selected)
+            fragments.agent_bubble(cache, selected)
+            if profile:
+                fragments.profile_card(cache, profile)
+            fragments.message_analysis(cache, selected)
+
+        def cold():
+            cache.clear()
+            fragments._relative_time.cache_clear()
+            rerun()
+
+        cold_ms = timed(cold, 200)
+        rerun()
+        warm_ms = timed(rerun, 200)
+        print(f"HTML per rerun: cold {cold_ms:.3f} ms  warm {warm_ms:.3f} ms  ({cold_ms / warm_ms:.1f}x)")
+
+        import plotly.graph_objects as go
+
+        def fresh_gauge():
+            fig = go.Figure(go.Indicator(
+                mode="gauge+number", value=12, title={'text': "Urgency Score"},
+                gauge={'axis': {'range': [0, 20]}, 'bar': {'color': "darkblue"},
+                       'steps': [{'range': [0, 7], 'color': "lightgreen"},
+                                 {'range': [7, 14], 'color': "yellow"},
+                                 {'range': [14, 20], 'color': "red"}]}
+            ))
+            fig.update_layout(height=200, margin=dict(l=10, r=10, t=30, b=10))
+            return fig
+
+        print(f"gauge: building a figure costs {timed(fresh_gauge, 50):.3f} ms; reruns reuse the cached one")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Database query rate with and without the host-wide shared cache.
+
+Starts N worker processes against one database, each replaying agent reruns
+for a fixed time. Every rerun reads the stats, canned responses, one of a
+few queue pages, a profile and a thread, and one worker also resolves a
+message every 25 reruns. Prints SQL statements per second across all
+workers and the cache hit ratios. Run from the repository root:
+
+    python benchmarks/shared_cache.py
+"""
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FILTERS = [
+    dict(status="unresolved"), dict(status="all"), dict(priority="high"), dict(category="loan_application"),
+    dict(category="payment"), dict(status="resolved"), dict(priority="low", status="unresolved"), dict(),
+]
+
+
+def worker(database_url, cache_path, duration, writer, seed, results):
+    sys.path.insert(0, ROOT)
+    import database
+    database.DATABASE_URL = database_url
+    from sqlalchemy import event
+    from repository import MessageRepository, QueueFilter
+    from shared_cache import SharedCache
+
+    engine = database.get_engine()
+    statements = [0]
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.__setitem__(0, statements[0] + 1))
+    repository = MessageRepository(shared_cache=SharedCache(cache_path) if cache_path else None)
+
+    rng = random.Random(seed)
+    message_ids = repository.get_message_ids(QueueFilter())
+    reruns = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        repository.get_message_stats()
+        repository.get_canned_responses()
+        repository.get_queue_page(QueueFilter(**rng.choice(FILTERS)))
+        thread = repository.get_thread(rng.choice(message_ids))
+        repository.get_customer_profile(thread.user_id)
+        reruns += 1
+        if writer and reruns % 25 == 0:
+            repository.update_message_status(rng.choice(message_ids), rng.choice(["pending", "resolved"]))
+        time.sleep(0.002)  # script overhead between reruns
+    results.put((statements[0], reruns, repository.read_model.stats()))
+
+
+def run(database_url, cache_path, workers, duration):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(database_url, cache_path, duration, i == 0, i, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    statements = sum(outcome[0] for outcome in outcomes)
+    reruns = sum(outcome[1] for outcome in outcomes)
+    hits = sum(outcome[2]["hits"] + outcome[2]["shared_hits"] for outcome in outcomes)
+    lookups = hits + sum(outcome[2]["misses"] for outcome in outcomes)
+    shared = sum(outcome[2]["shared_hits"] for outcome in outcomes)
+    return statements / duration, reruns / duration, hits / lookups, shared
+
+
+def main(duration=5.0):
+    workdir = tempfile.mkdtemp(prefix="cs_shared_")
+    cwd = os.getcwd()
+    try:
+        os.chdir(ROOT)
+        import database
+        database.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        database.init_database()
+
+        for workers in (1, 4, 8):
+            for label, cache_path in (("per-process", None),
+                                      ("shared", os.path.join(workdir, f"cache_{workers}.db"))):
+                queries, reruns, ratio, shared = run(database.DATABASE_URL, cache_path, workers, duration)
+                print(f"{workers} workers, {label:11s}: {queries:7.1f} queries/s for {reruns:6.0f} reruns/s  "
+                      f"hit ratio {ratio:.1%}  shared hits {shared}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
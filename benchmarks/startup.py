@@ -0,0 +1,97 @@
+"""Startup-time benchmark.
+
+Measures, each in a fresh interpreter:
+
+* cold process + empty database (schema bootstrap and CSV seed)
+* cold process + existing database (warm start: version check only)
+
+and, inside one process, how long a new agent session waits for the shared
+repository once the process is warm. Run from the repository root:
+
+    python benchmarks/startup.py
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a child interpreter; prints framework import, app import, bootstrap
+# and first-read timings, then whether the lazily loaded libraries got pulled in.
+CHILD = r"""
+import sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+import streamlit
+t1 = time.perf_counter()
+import database, repository, utils
+t2 = time.perf_counter()
+database.init_database()
+t3 = time.perf_counter()
+repo = repository.MessageRepository()
+repo.get_message_stats()
+repo.get_queue_page(repository.QueueFilter())
+t4 = time.perf_counter()
+print(t1 - t0, t2 - t1, t3 - t2, t4 - t3,
+      'pandas' in sys.modules, 'plotly.graph_objs._figure' in sys.modules)
+"""
+
+
+def run_child(workdir):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(root=ROOT)],
+        cwd=workdir, capture_output=True, text=True, check=True,
+    ).stdout.strip().splitlines()[-1].split()
+    return [float(x) * 1000 for x in out[:4]] + [out[4] == "True", out[5] == "True"]
+
+
+def report(label, runs):
+    framework, imports, bootstrap, first_read = (
+        statistics.median(r[i] for r in runs) for i in range(4)
+    )
+    print(f"{label:<28} streamlit {framework:6.1f} ms  app imports {imports:6.1f} ms  "
+          f"bootstrap {bootstrap:6.1f} ms  first read {first_read:5.1f} ms  "
+          f"app total {imports + bootstrap + first_read:6.1f} ms  "
+          f"(pandas loaded: {runs[-1][4]}, plotly figures loaded: {runs[-1][5]})")
+
+
+def main(repeats=5):
+    workdir = tempfile.mkdtemp(prefix="cs_startup_")
+    try:
+        shutil.copytree(os.path.join(ROOT, "data"), os.path.join(workdir, "data"))
+        db_path = os.path.join(workdir, "cs_messages.db")
+
+        cold = []
+        for _ in range(repeats):
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            cold.append(run_child(workdir))
+        report("cold process, empty db", cold)
+
+        warm = [run_child(workdir) for _ in range(repeats)]
+        report("cold process, existing db", warm)
+
+        # New browser sessions in a warm process only hit the shared repository.
+        os.chdir(workdir)
+        sys.path.insert(0, ROOT)
+        import database
+        import repository
+        database.init_database()
+        samples = []
+        for _ in range(200):
+            start = time.perf_counter()
+            database.init_database()
+            repository.MessageRepository().get_message_stats()
+            samples.append(time.perf_counter() - start)
+        print(f"{'new session, warm process':<28} median {statistics.median(samples) * 1000:.2f} ms")
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Incremental near-duplicate clustering of customer messages.
+
+Signatures come from :func:`utils.minhash_signature` at ingest time. Each
+message is looked up in the ``message_lsh_buckets`` table by its LSH band
+keys, compared against the exemplar signatures found there, and either joins
+the most similar cluster or starts its own. The bucket table holds at most
+one row per (bucket, cluster), so the work per message depends on the number
+of bands and nearby clusters, not on corpus size, and clustering stays linear.
+"""
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+
+import utils
+from database import CustomerMessage, MessageLshBucket
+
+# Minimum estimated Jaccard similarity (character shingles) to join a cluster
+CLUSTER_SIMILARITY = 0.5
+
+
+def assign_clusters(conn, messages: Iterable[Tuple[int, bytes]]) -> Dict[int, int]:
+    """Cluster ``(message_id, signature)`` pairs in arrival order.
+
+    Stores each signature and cluster id on ``customer_messages`` and
+    registers its buckets. Runs on the caller's connection/transaction, so
+    messages earlier in the same batch are visible to later ones.
+    Returns ``{message_id: cluster_id}``.
+    """
+    buckets_table = MessageLshBucket.__table__
+    clusters = {}
+
+    for message_id, signature in messages:
+        buckets = utils.lsh_buckets(signature)
+        candidates = conn.execute(
+            select(MessageLshBucket.cluster_id, CustomerMessage.signature)
+            .join(CustomerMessage, CustomerMessage.id == MessageLshBucket.message_id)
+            .where(MessageLshBucket.bucket.in_(buckets))
+        ).all()
+
+        cluster_id, best = message_id, CLUSTER_SIMILARITY
+        for candidate_cluster, exemplar in candidates:
+            similarity = utils.signature_similarity(signature, exemplar)
+            if similarity >= best:
+                cluster_id, best = candidate_cluster, similarity
+
+        conn.execute(
+            update(CustomerMessage)
+            .where(CustomerMessage.id == message_id)
+            .values(signature=signature, cluster_id=cluster_id)
+        )
+        conn.execute(
+            insert(buckets_table)
+            .values([
+                {'bucket': bucket, 'cluster_id': cluster_id, 'message_id': message_id}
+                for bucket in buckets
+            ])
+            .on_conflict_do_nothing()
+        )
+        clusters[message_id] = cluster_id
+
+    return clusters
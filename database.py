@@ -1,10 +1,10 @@
-import pandas as pd
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import create_engine, event, Column, Integer, Float, String, DateTime, Text, Boolean, Index, LargeBinary, select
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import sqlite3
 from datetime import datetime
 import os
+import threading
+import uuid
 
 Base = declarative_base()
 
@@ -23,6 +23,105 @@ class CustomerMessage(Base):
     urgency_score = Column(Integer, default=0)
     priority = Column(String(20), default='normal')  # low, normal, high
     category = Column(String(50), nullable=True)
+    signature = Column(LargeBinary, nullable=True)  # MinHash signature, see utils.minhash_signature
+    cluster_id = Column(Integer, nullable=True, index=True)  # id of the first message in its near-duplicate cluster
+
+    __table_args__ = (
+        # Queue ordering within a status, and each agent's own queue
+        Index('ix_customer_messages_status_urgency', 'status', 'urgency_score', 'timestamp'),
+        Index('ix_customer_messages_agent_status', 'agent_id', 'status'),
+        # Per-customer threads, and re-aggregating one customer's stats
+        Index('ix_customer_messages_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+class MessageLshBucket(Base):
+    """LSH band bucket -> near-duplicate cluster, with the member whose signature put it there"""
+    __tablename__ = 'message_lsh_buckets'
+    
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    cluster_id = Column(Integer, primary_key=True, autoincrement=False)
+    message_id = Column(Integer, nullable=False)
+
+class ChangeLog(Base):
+    """Row-level change stream, appended to by triggers on the tables below"""
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        Index('ix_change_log_table_seq', 'table_name', 'seq'),
+        {'sqlite_autoincrement': True},  # never reuse sequence numbers after pruning
+    )
+    
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    row_id = Column(Integer, nullable=False)
+
+class OutboundMessage(Base):
+    """Outbox row: one response to deliver to a customer through the gateway"""
+    __tablename__ = 'outbound_messages'
+    __table_args__ = (
+        # Workers claim due rows in next_attempt_at order
+        Index('ix_outbound_messages_status_due', 'status', 'next_attempt_at'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    body = Column(Text, nullable=False)
+    idempotency_key = Column(String(64), nullable=False, unique=True)  # same response to the same message sends once
+    status = Column(String(20), nullable=False, default='queued')  # queued, sending, delivered, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)  # due time, or lease expiry while sending
+    last_error = Column(Text, nullable=True)
+    gateway_message_id = Column(String(64), nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    delivered_at = Column(DateTime, nullable=True)
+
+class CustomerStats(Base):
+    """Per-customer message aggregates, kept current by triggers on customer_messages"""
+    __tablename__ = 'customer_stats'
+    
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    message_count = Column(Integer, nullable=False, default=0)
+    open_count = Column(Integer, nullable=False, default=0)  # not resolved
+    pending_count = Column(Integer, nullable=False, default=0)
+    in_progress_count = Column(Integer, nullable=False, default=0)
+    resolved_count = Column(Integer, nullable=False, default=0)
+    urgency_sum = Column(Integer, nullable=False, default=0)
+    max_urgency = Column(Integer, nullable=False, default=0)
+    first_message_at = Column(DateTime, nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    category_counts = Column(Text, nullable=False, default='{}')  # JSON object, category -> messages
+
+class MaintenanceRun(Base):
+    """Last run of each maintenance task, shared by every process using the database"""
+    __tablename__ = 'maintenance_runs'
+    
+    task = Column(String(50), primary_key=True)
+    last_run = Column(Float, nullable=False, default=0.0)  # unix time the last run started
+    duration = Column(Float, nullable=True)  # seconds
+    detail = Column(Text, nullable=True)
+
+class MaintenanceActivity(Base):
+    """Recent app traffic reported by each process, so low load is judged across all of them"""
+    __tablename__ = 'maintenance_activity'
+
+    process = Column(String(64), primary_key=True)
+    reported = Column(Float, nullable=False)  # unix time of the report
+    reruns = Column(Integer, nullable=False)  # reruns in the reporting process's load window
+
+class DatabaseInfo(Base):
+    """Facts about the database file itself, such as its random id"""
+    __tablename__ = 'database_info'
+
+    key = Column(String(50), primary_key=True)
+    value = Column(Text, nullable=False)
+
+# Tables whose inserts, updates and deletes are recorded in change_log, with their key column
+TRACKED_TABLES = {
+    'customer_messages': 'id',
+    'canned_responses': 'id',
+    'customer_profiles': 'user_id',
+    'outbound_messages': 'id',
+}
 
 class CannedResponse(Base):
     """Database model for canned responses"""
@@ -49,15 +148,268 @@ class CustomerProfile(Base):
     total_repaid = Column(Integer, default=0)
     credit_score = Column(Integer, default=700)
 
+DATABASE_URL = 'sqlite:///cs_messages.db'
+
+# SQLite page cache per connection
+PAGE_CACHE_KIB = 16 * 1024
+
+# Stored in SQLite's PRAGMA user_version. Bump it whenever the schema or seed
+# data changes so existing databases are bootstrapped again on next start.
+SCHEMA_VERSION = 10
+
+# Schema migrations keyed by the version they upgrade to. They run after
+# create_all() on every bootstrap, so each one must be idempotent.
+MIGRATIONS = {}
+
+def migration(version):
+    """Register a schema migration"""
+    def register(func):
+        MIGRATIONS[version] = func
+        return func
+    return register
+
+_engine = None
+_bootstrap_lock = threading.Lock()
+_bootstrapped = False
+
+def create_indexes(conn, table, *names):
+    """Create the named indexes declared on a model's table, if missing"""
+    for index in table.indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+def add_column_if_missing(conn, table_name, column_name, ddl_type):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table_name})")}
+    if column_name not in columns:
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl_type}")
+
+@migration(2)
+def add_routing_indexes(conn):
+    """Indexes behind the assignment engine and per-agent queues"""
+    create_indexes(conn, CustomerMessage.__table__,
+                   'ix_customer_messages_status_urgency', 'ix_customer_messages_agent_status')
+
+@migration(3)
+def add_message_clusters(conn):
+    """Near-duplicate signatures and clusters; backfills rows that predate them"""
+    from clustering import assign_clusters
+    import utils
+
+    add_column_if_missing(conn, 'customer_messages', 'signature', 'BLOB')
+    add_column_if_missing(conn, 'customer_messages', 'cluster_id', 'INTEGER')
+    create_indexes(conn, CustomerMessage.__table__, 'ix_customer_messages_cluster_id')
+
+    rows = conn.execute(
+        select(CustomerMessage.id, CustomerMessage.message_body)
+        .where(CustomerMessage.signature.is_(None))
+        .order_by(CustomerMessage.id)
+    ).all()
+    assign_clusters(conn, [(message_id, utils.minhash_signature(body)) for message_id, body in rows])
+
+def create_change_log_triggers(conn, table_names):
+    """Feed change_log from every insert, update and delete on the given tracked tables"""
+    for table_name in table_names:
+        key = TRACKED_TABLES[table_name]
+        for operation, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table_name}_{operation.lower()} "
+                f"AFTER {operation} ON {table_name} BEGIN "
+                f"INSERT INTO change_log (table_name, row_id) VALUES ('{table_name}', {row}.{key}); "
+                f"END"
+            )
+
+@migration(4)
+def add_change_log_triggers(conn):
+    """Feed change_log from every write to the tracked tables"""
+    ChangeLog.__table__.create(conn, checkfirst=True)
+    create_change_log_triggers(conn, ['customer_messages', 'canned_responses', 'customer_profiles'])
+
+@migration(5)
+def add_outbox(conn):
+    """Outbound delivery queue"""
+    OutboundMessage.__table__.create(conn, checkfirst=True)
+
+@migration(6)
+def track_outbox_changes(conn):
+    """Outbox writes bump its change counter, which versions cached delivery status"""
+    create_change_log_triggers(conn, ['outbound_messages'])
+
+def _customer_stats_remove(row):
+    """Trigger statements taking one message (OLD) out of its customer's stats"""
+    category = f"'$.\"' || COALESCE({row}.category, 'other') || '\"'"
+    # Extremes can only be recomputed, from the customer's remaining messages via their index
+    return (
+        f"UPDATE customer_stats SET "
+        f"message_count = message_count - 1, "
+        f"open_count = open_count - ({row}.status IS NOT 'resolved'), "
+        f"pending_count = pending_count - ({row}.status IS 'pending'), "
+        f"in_progress_count = in_progress_count - ({row}.status IS 'in_progress'), "
+        f"resolved_count = resolved_count - ({row}.status IS 'resolved'), "
+        f"urgency_sum = urgency_sum - COALESCE({row}.urgency_score, 0), "
+        f"max_urgency = CASE WHEN COALESCE({row}.urgency_score, 0) < max_urgency THEN max_urgency ELSE "
+        f"(SELECT COALESCE(MAX(urgency_score), 0) FROM customer_messages WHERE user_id = {row}.user_id) END, "
+        f"first_message_at = CASE WHEN {row}.timestamp > first_message_at THEN first_message_at ELSE "
+        f"(SELECT MIN(timestamp) FROM customer_messages WHERE user_id = {row}.user_id) END, "
+        f"last_message_at = CASE WHEN {row}.timestamp < last_message_at THEN last_message_at ELSE "
+        f"(SELECT MAX(timestamp) FROM customer_messages WHERE user_id = {row}.user_id) END, "
+        f"category_counts = CASE WHEN json_extract(category_counts, {category}) > 1 "
+        f"THEN json_set(category_counts, {category}, json_extract(category_counts, {category}) - 1) "
+        f"ELSE json_remove(category_counts, {category}) END "
+        f"WHERE user_id = {row}.user_id; "
+    )
+
+def _customer_stats_add(row):
+    """Trigger statements adding one message (NEW) to its customer's stats"""
+    category = f"'$.\"' || COALESCE({row}.category, 'other') || '\"'"
+    return (
+        f"INSERT OR IGNORE INTO customer_stats (user_id, message_count, open_count, pending_count, "
+        f"in_progress_count, resolved_count, urgency_sum, max_urgency, first_message_at, last_message_at, "
+        f"category_counts) VALUES ({row}.user_id, 0, 0, 0, 0, 0, 0, 0, {row}.timestamp, {row}.timestamp, '{{}}'); "
+        f"UPDATE customer_stats SET "
+        f"message_count = message_count + 1, "
+        f"open_count = open_count + ({row}.status IS NOT 'resolved'), "
+        f"pending_count = pending_count + ({row}.status IS 'pending'), "
+        f"in_progress_count = in_progress_count + ({row}.status IS 'in_progress'), "
+        f"resolved_count = resolved_count + ({row}.status IS 'resolved'), "
+        f"urgency_sum = urgency_sum + COALESCE({row}.urgency_score, 0), "
+        f"max_urgency = MAX(max_urgency, COALESCE({row}.urgency_score, 0)), "
+        f"first_message_at = MIN(COALESCE(first_message_at, {row}.timestamp), {row}.timestamp), "
+        f"last_message_at = MAX(COALESCE(last_message_at, {row}.timestamp), {row}.timestamp), "
+        f"category_counts = json_set(category_counts, {category}, "
+        f"COALESCE(json_extract(category_counts, {category}), 0) + 1) "
+        f"WHERE user_id = {row}.user_id; "
+    )
+
+def create_customer_stats_triggers(conn):
+    """Keep customer_stats current from every insert, delete and relevant update of customer_messages"""
+    # The OLD customer's row goes once it has no messages left
+    drop_empty = "DELETE FROM customer_stats WHERE user_id = OLD.user_id AND message_count <= 0; "
+    triggers = {
+        'insert': ("AFTER INSERT", _customer_stats_add('NEW')),
+        'delete': ("AFTER DELETE", _customer_stats_remove('OLD') + drop_empty),
+        'update': ("AFTER UPDATE OF user_id, timestamp, status, urgency_score, category",
+                   _customer_stats_remove('OLD') + _customer_stats_add('NEW') + drop_empty),
+    }
+    for name, (timing, body) in triggers.items():
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS trg_customer_stats_{name} "
+            f"{timing} ON customer_messages BEGIN {body}END"
+        )
+
+def rebuild_customer_stats(conn):
+    """Recompute customer_stats from scratch (backfill, or repair after out-of-band edits)"""
+    conn.exec_driver_sql("DELETE FROM customer_stats")
+    conn.exec_driver_sql(
+        "INSERT INTO customer_stats (user_id, message_count, open_count, pending_count, in_progress_count, "
+        "resolved_count, urgency_sum, max_urgency, first_message_at, last_message_at, category_counts) "
+        "SELECT user_id, COUNT(*), SUM(status IS NOT 'resolved'), SUM(status IS 'pending'), "
+        "SUM(status IS 'in_progress'), SUM(status IS 'resolved'), SUM(COALESCE(urgency_score, 0)), "
+        "MAX(COALESCE(urgency_score, 0)), MIN(timestamp), MAX(timestamp), "
+        "(SELECT json_group_object(category, messages) FROM ("
+        "SELECT COALESCE(category, 'other') AS category, COUNT(*) AS messages FROM customer_messages AS c "
+        "WHERE c.user_id = m.user_id GROUP BY 1)) "
+        "FROM customer_messages AS m GROUP BY user_id"
+    )
+
+@migration(7)
+def add_maintenance_runs(conn):
+    """Schedule state for the maintenance tasks"""
+    MaintenanceRun.__table__.create(conn, checkfirst=True)
+
+@migration(8)
+def add_customer_stats(conn):
+    """Per-customer aggregates for the profile panel and customer-level queue sorts"""
+    create_indexes(conn, CustomerMessage.__table__, 'ix_customer_messages_user_timestamp')
+    CustomerStats.__table__.create(conn, checkfirst=True)
+    create_customer_stats_triggers(conn)
+    rebuild_customer_stats(conn)
+
+@migration(9)
+def add_database_id(conn):
+    """A random id, so caches keyed on change_log sequences never mix two databases' timelines"""
+    DatabaseInfo.__table__.create(conn, checkfirst=True)
+    stamp_database_id(conn, replace=False)
+
+@migration(10)
+def add_maintenance_activity(conn):
+    """Shared traffic reports for the maintenance scheduler's low-load check"""
+    MaintenanceActivity.__table__.create(conn, checkfirst=True)
+
+def stamp_database_id(conn, replace=True):
+    """Give the database a new random id (keep an existing one unless ``replace``)"""
+    verb = "REPLACE" if replace else "IGNORE"
+    conn.exec_driver_sql(f"INSERT OR {verb} INTO database_info (key, value) VALUES ('database_id', ?)",
+                         (uuid.uuid4().hex,))
+
+def get_database_id(engine):
+    """Read the random id stamped on the database at bootstrap"""
+    with engine.connect() as conn:
+        return conn.execute(select(DatabaseInfo.value).where(DatabaseInfo.key == 'database_id')).scalar()
+
+def configure_connection(dbapi_connection, connection_record=None):
+    """Per-connection pragmas: WAL journal, a larger page cache, incremental vacuum for new files"""
+    cursor = dbapi_connection.cursor()
+    # Only takes effect before the first table is created; existing files are converted by maintenance
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute(f"PRAGMA cache_size = -{PAGE_CACHE_KIB}")
+    cursor.close()
+
+def get_engine():
+    """Get the process-wide database engine"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL)
+        event.listen(_engine, 'connect', configure_connection)
+    return _engine
+
+def get_schema_version(engine):
+    """Read the schema version stamped on the database file"""
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
 def init_database():
-    """Initialize the database and load CSV data"""
-    # Create SQLite database
-    engine = create_engine('sqlite:///cs_messages.db')
+    """Bootstrap the schema and seed data, at most once per process.
+
+    Warm starts only read ``PRAGMA user_version``; ``create_all``, migrations
+    and the seed check run only when the stamped version is out of date.
+    """
+    global _bootstrapped
+    engine = get_engine()
+    if _bootstrapped:
+        return engine
+
+    with _bootstrap_lock:
+        if not _bootstrapped:
+            version = get_schema_version(engine)
+            if version != SCHEMA_VERSION:
+                bootstrap_schema(engine, version)
+            _bootstrapped = True
+    return engine
+
+def bootstrap_schema(engine, from_version=0):
+    """Create tables, apply migrations, seed an empty database and stamp the version"""
     Base.metadata.create_all(engine)
-    
+
+    with engine.begin() as conn:
+        for version in sorted(MIGRATIONS):
+            if version > from_version:
+                MIGRATIONS[version](conn)
+
     Session = sessionmaker(bind=engine)
     session = Session()
-    
+    try:
+        seed_database(session)
+    finally:
+        session.close()
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def seed_database(session):
+    """Load the CSV data and sample records into an empty database"""
     # Check if data already exists
     existing_messages = session.query(CustomerMessage).first()
     
@@ -65,6 +417,8 @@ def init_database():
         # Load CSV data
         csv_path = os.path.join('data', 'GeneralistRails_Project_MessageData.csv')
         if os.path.exists(csv_path):
+            import pandas as pd
+
             df = pd.read_csv(csv_path)
             
             # Clean and process data
@@ -123,6 +477,14 @@ def init_database():
                 messages.append(message)
             
             session.add_all(messages)
+            session.flush()
+            
+            # Group near-duplicates now that the messages have ids
+            from clustering import assign_clusters
+            import utils
+            assign_clusters(session.connection(), [
+                (message.id, utils.minhash_signature(message.message_body)) for message in messages
+            ])
             
             # Create sample canned responses
             canned_responses = [
@@ -170,6 +532,7 @@ def init_database():
             unique_user_ids = df['User ID'].unique()[:20]  # First 20 users for sample
             
             for user_id in unique_user_ids:
+                user_id = int(user_id)  # numpy ints would be stored as BLOBs
                 profile = CustomerProfile(
                     user_id=int(user_id),
                     name=f"Customer {user_id}",
@@ -190,12 +553,8 @@ def init_database():
             print(f"Loaded {len(messages)} messages, {len(canned_responses)} canned responses, and {len(profiles)} customer profiles.")
         else:
             print(f"CSV file not found at {csv_path}")
-    
-    session.close()
-    return engine
 
 def get_session():
     """Get database session"""
-    engine = create_engine('sqlite:///cs_messages.db')
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     return Session()
@@ -0,0 +1,270 @@
+"""Outbound delivery of agent responses.
+
+Responses are written to the ``outbound_messages`` outbox in the same
+transaction that stores them on the message, so a response is never saved
+without being queued (or queued without being saved). A
+:class:`DeliveryDispatcher` runs a pool of asyncio workers that claim due
+outbox rows in batches, hand each batch to a :class:`Gateway`, and record
+the outcome: delivered, retried later with capped exponential backoff and
+jitter, or failed after ``MAX_ATTEMPTS`` (or on a permanent error).
+
+Claims are leases: a worker that dies mid-send leaves its rows ``sending``
+until the lease runs out, then they are retried. Every send carries the
+row's idempotency key, so a gateway can drop the duplicate if the first
+attempt did get through.
+
+:class:`MockGateway` stands in for an SMS/chat provider so throughput and
+latency can be measured offline (see ``benchmarks/delivery.py``). The app
+sends through the gateway named by the ``CS_DELIVERY_GATEWAY`` environment
+variable (``module:Class``, or ``mock``); without one, responses stay queued.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import random
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from repository import MessageRepository, OutboundRecord
+
+logger = logging.getLogger(__name__)
+
+WORKERS = 4
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+
+# Retry n waits about BASE_BACKOFF * 2**(n-1) seconds, capped at MAX_BACKOFF
+BASE_BACKOFF = 2.0
+MAX_BACKOFF = 300.0
+
+# How long a claimed batch may stay in flight before other workers may retry it
+LEASE = timedelta(seconds=60)
+
+# Idle workers poll this often; notify() wakes them sooner
+POLL_INTERVAL = 1.0
+
+# Environment variable naming the app's gateway: "module:Class", or "mock" for MockGateway
+GATEWAY_ENV = "CS_DELIVERY_GATEWAY"
+
+
+@dataclass(frozen=True)
+class SendResult:
+    """Gateway verdict for one outbox row"""
+    outbox_id: int
+    ok: bool
+    gateway_message_id: Optional[str] = None
+    error: Optional[str] = None
+    retryable: bool = True
+
+
+class Gateway:
+    """Delivery provider interface.
+
+    Implementations send a batch of outbox rows and report one
+    :class:`SendResult` per row. Rows missing from the result are retried.
+    Raising fails the whole batch, which is then retried.
+    """
+
+    # Largest batch the provider accepts in one call
+    max_batch = BATCH_SIZE
+    # True for stand-ins that never reach a customer, so the UI can say so
+    simulated = False
+
+    async def send_batch(self, messages: Sequence[OutboundRecord]) -> List[SendResult]:
+        raise NotImplementedError
+
+
+class MockGateway(Gateway):
+    """In-process gateway with configurable latency and failure rates.
+
+    Honours idempotency keys the way a real provider should: resending a key
+    that was already delivered returns the original gateway id.
+    """
+
+    simulated = True
+
+    def __init__(self, latency: float = 0.05, per_message_latency: float = 0.0005,
+                 failure_rate: float = 0.0, permanent_failure_rate: float = 0.0,
+                 max_batch: int = 100, seed: Optional[int] = None):
+        self.latency = latency
+        self.per_message_latency = per_message_latency
+        self.failure_rate = failure_rate
+        self.permanent_failure_rate = permanent_failure_rate
+        self.max_batch = max_batch
+        self._rng = random.Random(seed)
+        self._delivered: Dict[str, str] = {}  # idempotency key -> gateway message id
+        self.calls = 0
+        self.duplicates = 0
+
+    async def send_batch(self, messages: Sequence[OutboundRecord]) -> List[SendResult]:
+        self.calls += 1
+        await asyncio.sleep(self.latency + self.per_message_latency * len(messages))
+        results = []
+        for message in messages:
+            gateway_id = self._delivered.get(message.idempotency_key)
+            if gateway_id is not None:
+                self.duplicates += 1
+                results.append(SendResult(message.id, True, gateway_id))
+                continue
+            roll = self._rng.random()
+            if roll < self.permanent_failure_rate:
+                results.append(SendResult(message.id, False, error="invalid recipient", retryable=False))
+            elif roll < self.permanent_failure_rate + self.failure_rate:
+                results.append(SendResult(message.id, False, error="gateway timeout"))
+            else:
+                gateway_id = f"mock-{uuid.uuid4().hex[:12]}"
+                self._delivered[message.idempotency_key] = gateway_id
+                results.append(SendResult(message.id, True, gateway_id))
+        return results
+
+
+def load_gateway(spec: Optional[str] = None) -> Optional[Gateway]:
+    """Instantiate the gateway named by ``spec`` (default: ``$CS_DELIVERY_GATEWAY``); None if unset"""
+    spec = os.environ.get(GATEWAY_ENV, "") if spec is None else spec
+    if not spec:
+        return None
+    if spec == "mock":
+        return MockGateway()
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"{GATEWAY_ENV} must look like 'module:Class' or 'mock', got {spec!r}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def backoff_delay(attempts: int, base: float = BASE_BACKOFF, cap: float = MAX_BACKOFF,
+                  rng: random.Random = random) -> float:
+    """Seconds to wait after failed attempt number ``attempts``: capped exponential with jitter"""
+    return min(cap, base * 2 ** (attempts - 1)) * rng.uniform(0.5, 1.0)
+
+
+class DeliveryDispatcher:
+    """Pool of asyncio workers moving outbox rows through a gateway"""
+
+    def __init__(self, repository: MessageRepository, gateway: Gateway,
+                 workers: int = WORKERS, batch_size: int = BATCH_SIZE,
+                 max_attempts: int = MAX_ATTEMPTS, base_backoff: float = BASE_BACKOFF,
+                 max_backoff: float = MAX_BACKOFF, lease: timedelta = LEASE,
+                 poll_interval: float = POLL_INTERVAL):
+        self.repository = repository
+        self.gateway = gateway
+        self.workers = workers
+        self.batch_size = min(batch_size, gateway.max_batch)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self._wake: Optional[asyncio.Event] = None
+
+    async def dispatch_once(self) -> int:
+        """Claim, send and settle one batch; returns the number of rows claimed"""
+        # A read-only check first, so idle polling never takes the write lock
+        if not await asyncio.to_thread(self.repository.has_due_outbound):
+            return 0
+        batch = await asyncio.to_thread(self.repository.claim_outbound, self.batch_size, self.lease)
+        if not batch:
+            return 0
+
+        try:
+            # Give up well before the lease expires so no other worker has re-claimed the rows
+            results = await asyncio.wait_for(self.gateway.send_batch(batch), self.lease.total_seconds() / 2)
+        except Exception as exc:
+            logger.warning("Gateway call failed for %d messages: %s", len(batch), exc)
+            error = f"{type(exc).__name__}: {exc}"
+            results = [SendResult(record.id, False, error=error) for record in batch]
+
+        by_id = {result.outbox_id: result for result in results}
+        now = datetime.now()
+        delivered, retry, failed = [], [], []
+        for record in batch:
+            result = by_id.get(record.id) or SendResult(record.id, False, error="no result from gateway")
+            if result.ok:
+                delivered.append((record.id, result.gateway_message_id))
+            elif not result.retryable or record.attempts >= self.max_attempts:
+                failed.append((record.id, result.error))
+            else:
+                delay = backoff_delay(record.attempts, self.base_backoff, self.max_backoff)
+                retry.append((record.id, result.error, now + timedelta(seconds=delay)))
+
+        await asyncio.to_thread(self.repository.settle_outbound, delivered, retry, failed)
+        self.delivered += len(delivered)
+        self.retried += len(retry)
+        self.failed += len(failed)
+        return len(batch)
+
+    def notify(self):
+        """Wake idle workers (call from the event loop's thread)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _worker(self, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                claimed = await self.dispatch_once()
+            except Exception:
+                logger.exception("Delivery worker error")
+                claimed = 0
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def run(self, stop: asyncio.Event):
+        """Run the worker pool until ``stop`` is set"""
+        self._wake = asyncio.Event()
+        waker = asyncio.create_task(self._wake_on(stop))
+        try:
+            await asyncio.gather(*(self._worker(stop) for _ in range(self.workers)))
+        finally:
+            waker.cancel()
+
+    async def _wake_on(self, stop: asyncio.Event):
+        await stop.wait()
+        self._wake.set()
+
+
+class DeliveryService:
+    """Runs a dispatcher on its own event loop in a daemon thread; one per process"""
+
+    def __init__(self, dispatcher: DeliveryDispatcher):
+        self.dispatcher = dispatcher
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._started = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "DeliveryService":
+        if self._thread is None:
+            self._thread = threading.Thread(target=asyncio.run, args=(self._main(),),
+                                            name="delivery", daemon=True)
+            self._thread.start()
+            self._started.wait()
+        return self
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._started.set()
+        await self.dispatcher.run(self._stop)
+
+    def notify(self):
+        """Tell the workers new responses were queued (thread-safe)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.dispatcher.notify)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the workers and wait for in-flight batches to settle"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
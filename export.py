@@ -0,0 +1,160 @@
+"""Streaming export of filtered message sets to CSV or Parquet.
+
+Exports take the same :class:`repository.QueueFilter` as the queue, so a
+slice is whatever the sidebar would show, minus the page ``limit``. Rows come
+off a server-side cursor in fixed-size batches and go straight to the output
+file (one Parquet row group per batch), so memory stays flat however many rows
+match. Parquet needs the optional ``pyarrow`` package.
+
+Also usable from the command line, from the repository root::
+
+    python export.py --category fraud --since 2024-01-01 --until 2024-02-01 fraud.csv
+    python export.py --status unresolved --category loan_application loans.parquet
+"""
+import argparse
+import csv
+import io
+import shlex
+import sys
+from datetime import datetime
+from typing import BinaryIO, Iterable, List, Union
+
+from repository import MESSAGE_STATUSES, UNRESOLVED, MessageRepository, QueueFilter
+
+EXPORT_COLUMNS = (
+    'id', 'user_id', 'timestamp', 'message_body', 'agent_id', 'response', 'response_timestamp',
+    'status', 'urgency_score', 'priority', 'category', 'cluster_id',
+)
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+# Rows fetched from the cursor and written per batch
+EXPORT_BATCH_SIZE = 5000
+
+MIME_TYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# Largest export offered as a browser download: Streamlit holds the whole file in memory
+UI_EXPORT_MAX_ROWS = 50000
+
+
+def write_csv(batches: Iterable[List[tuple]], out: BinaryIO) -> int:
+    """Write row batches as UTF-8 CSV with a header; returns the row count"""
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    try:
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_COLUMNS)
+        count = 0
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+        text.flush()
+        return count
+    finally:
+        # Leave the caller's file open
+        text.detach()
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    timestamp = pa.timestamp('us')
+    return pa.schema([
+        ('id', pa.int64()), ('user_id', pa.int64()), ('timestamp', timestamp),
+        ('message_body', pa.string()), ('agent_id', pa.string()), ('response', pa.string()),
+        ('response_timestamp', timestamp), ('status', pa.string()), ('urgency_score', pa.int64()),
+        ('priority', pa.string()), ('category', pa.string()), ('cluster_id', pa.int64()),
+    ])
+
+
+def write_parquet(batches: Iterable[List[tuple]], out: BinaryIO) -> int:
+    """Write row batches as Parquet, one row group per batch; returns the row count"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow") from exc
+
+    schema = _parquet_schema()
+    count = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            count += len(rows)
+    return count
+
+
+def export_messages(repository: MessageRepository, filters: QueueFilter,
+                    out: Union[str, BinaryIO], fmt: str = 'csv',
+                    batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Stream every message matching ``filters`` to a path or binary file; returns the row count"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if isinstance(out, str):
+        with open(out, 'wb') as f:
+            return export_messages(repository, filters, f, fmt, batch_size)
+
+    batches = repository.iter_rows(filters, EXPORT_COLUMNS, batch_size)
+    writer = write_csv if fmt == 'csv' else write_parquet
+    return writer(batches, out)
+
+
+def command_line(filters: QueueFilter, output: str) -> str:
+    """The ``python export.py`` invocation that exports the same slice to ``output``"""
+    args = ['python', 'export.py']
+    for flag, value in (('--search', filters.search_query), ('--priority', filters.priority),
+                        ('--status', filters.status), ('--category', filters.category)):
+        if value and value != 'all':
+            args += [flag, value]
+    if filters.agent_id is not None:
+        args += ['--agent', filters.agent_id]
+    if filters.since is not None:
+        args += ['--since', filters.since.isoformat()]
+    if filters.until is not None:
+        args += ['--until', filters.until.isoformat()]
+    return shlex.join(args + [output])
+
+
+def _parse_date(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"not an ISO date: {value}") from exc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export filtered customer messages to CSV or Parquet")
+    parser.add_argument('output', help="output file, or - for CSV on stdout")
+    parser.add_argument('--format', choices=EXPORT_FORMATS,
+                        help="defaults to the output file extension, else csv")
+    parser.add_argument('--search', default="", help="substring of the message body or user id")
+    parser.add_argument('--priority', default="all")
+    parser.add_argument('--status', default="all", choices=["all", UNRESOLVED] + MESSAGE_STATUSES)
+    parser.add_argument('--category', default="all")
+    parser.add_argument('--agent', default=None, help="assigned agent id")
+    parser.add_argument('--since', type=_parse_date, help="received on or after (ISO date/time)")
+    parser.add_argument('--until', type=_parse_date, help="received before (ISO date/time)")
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    if args.output == '-' and fmt != 'csv':
+        parser.error("only CSV can be written to stdout")
+
+    from database import init_database
+    init_database()
+
+    filters = QueueFilter(
+        search_query=args.search, priority=args.priority, status=args.status,
+        category=args.category, agent_id=args.agent, since=args.since, until=args.until
+    )
+    out = sys.stdout.buffer if args.output == '-' else args.output
+    count = export_messages(MessageRepository(), filters, out, fmt, args.batch_size)
+    print(f"Exported {count} messages", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
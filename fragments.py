@@ -0,0 +1,201 @@
+"""Render cache for the HTML fragments drawn on every rerun.
+
+Queue rows, chat bubbles and the profile cards are pure functions of an
+immutable record (plus whether the row is selected). Each fragment is built
+once per record version, split around its relative-time text, and kept in a
+process-wide LRU. A rerun then only joins the cached halves with the
+relative time, which is itself memoised per timestamp and one-minute bucket.
+A changed message is a new record, so it misses and is rebuilt.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Hashable, Optional, Tuple
+
+import utils
+from repository import CustomerStatsRecord, MessageRecord, ProfileRecord
+
+# Fragments kept before the least recently used are dropped
+MAX_FRAGMENTS = 5000
+
+# Relative times ("5m ago") are recomputed at most once per bucket
+TIME_BUCKET_SECONDS = 60
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments, shared by every session in a process"""
+
+    def __init__(self, maxsize: int = MAX_FRAGMENTS):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._fragments: "OrderedDict[Hashable, object]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def get(self, key: Hashable, build: Callable[[], object]):
+        """Cached fragment for ``key``, built on a miss"""
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+        # Build outside the lock; two sessions racing on a miss build the same value
+        fragment = build()
+        with self._lock:
+            self.misses += 1
+            self._fragments[key] = fragment
+            if len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.hits = self.misses = 0
+
+
+def time_bucket(now: Optional[datetime] = None) -> int:
+    """Index of the current relative-time bucket"""
+    return int((now or datetime.now()).timestamp() // TIME_BUCKET_SECONDS)
+
+
+@lru_cache(maxsize=4096)
+def _relative_time(timestamp, bucket: int) -> str:
+    return utils.format_timestamp(timestamp)
+
+
+def relative_time(timestamp) -> str:
+    """utils.format_timestamp, memoised for the current time bucket"""
+    return _relative_time(timestamp, time_bucket())
+
+
+def _split(html: str, marker: str = "\x00time\x00") -> Tuple[str, str]:
+    head, _, tail = html.partition(marker)
+    return head, tail
+
+
+def queue_item(cache: FragmentCache, msg: MessageRecord, is_selected: bool) -> str:
+    """HTML for one queue row"""
+    def build():
+        priority_color = utils.get_priority_color(msg.priority)
+        status_color = utils.get_status_color(msg.status)
+        return _split(f"""
+            <div class='message-item {'selected' if is_selected else ''}' onclick='selectMessage({msg.id})'>
+                <div style='display: flex; justify-content: space-between; align-items: center;'>
+                    <strong>Customer {msg.user_id}</strong>
+                    <small style='color: #666;'>\x00time\x00</small>
+                </div>
+                <div style='margin: 8px 0; font-size: 0.9em; color: #444;'>
+                    {msg.message_body[:60]}...
+                </div>
+                <div style='display: flex; gap: 4px;'>
+                    <span class='priority-badge' style='background-color: {priority_color}; color: white;'>
+                        {msg.priority.upper()}
+                    </span>
+                    <span class='status-badge' style='background-color: {status_color}; color: white;'>
+                        {msg.status.replace('_', ' ').upper()}
+                    </span>
+                    {f"<span class='status-badge' style='background-color: #6f42c1; color: white;'>×{msg.cluster_size} SIMILAR</span>" if msg.cluster_size > 1 else ""}
+                </div>
+            </div>
+            """)
+
+    head, tail = cache.get(('queue_item', msg, is_selected), build)
+    return head + relative_time(msg.timestamp) + tail
+
+
+def customer_bubble(cache: FragmentCache, msg: MessageRecord) -> str:
+    """HTML for the customer's message in the chat panel"""
+    def build():
+        return _split(f"""
+                <div class='customer-message'>
+                    <div style='font-weight: bold; margin-bottom: 4px;'>Customer {msg.user_id}</div>
+                    <div>{msg.message_body}</div>
+                    <div style='font-size: 0.8em; color: #666; margin-top: 8px;'>
+                        \x00time\x00
+                    </div>
+                </div>
+                """)
+
+    head, tail = cache.get(('customer_bubble', msg.id, msg.user_id, msg.message_body), build)
+    return head + relative_time(msg.timestamp) + tail
+
+
+def agent_bubble(cache: FragmentCache, msg: MessageRecord) -> str:
+    """HTML for the agent's response in the chat panel"""
+    def build():
+        return _split(f"""
+                    <div class='agent-message'>
+                        <div style='font-weight: bold; margin-bottom: 4px;'>{msg.agent_id or 'Agent'}</div>
+                        <div>{msg.response}</div>
+                        <div style='font-size: 0.8em; color: rgba(255,255,255,0.8); margin-top: 8px;'>
+                            \x00time\x00
+                        </div>
+                    </div>
+                    """)
+
+    head, tail = cache.get(('agent_bubble', msg.id, msg.agent_id, msg.response), build)
+    return head + relative_time(msg.response_timestamp) + tail
+
+
+def profile_card(cache: FragmentCache, profile: ProfileRecord) -> str:
+    """HTML for the customer information card"""
+    def build():
+        return f"""
+                <div class='metric-card'>
+                    <h4 style='margin: 0 0 10px 0;'>Customer Information</h4>
+                    <p><strong>Name:</strong> {profile.name}</p>
+                    <p><strong>Phone:</strong> {profile.phone}</p>
+                    <p><strong>Email:</strong> {profile.email or 'N/A'}</p>
+                    <p><strong>Credit Score:</strong> <span style='color: {'#4CAF50' if profile.credit_score >= 700 else '#FF9800' if profile.credit_score >= 600 else '#FF4B4B'}'>
+                        {profile.credit_score}
+                    </span></p>
+                    <p><strong>Repayment History:</strong> <span style='color: {'#4CAF50' if profile.repayment_history == 'good' else '#FF9800' if profile.repayment_history == 'fair' else '#FF4B4B'}'>
+                        {profile.repayment_history.upper()}
+                    </span></p>
+                    <p><strong>Total Loans:</strong> {profile.total_loans}</p>
+                    <p><strong>Total Repaid:</strong> Ksh {profile.total_repaid:,}</p>
+                    <p><strong>Last Loan:</strong> Ksh {profile.last_loan_amount:,}</p>
+                </div>
+                """
+
+    return cache.get(('profile_card', profile), build)
+
+
+def customer_activity_card(cache: FragmentCache, stats: CustomerStatsRecord) -> str:
+    """HTML for the customer's message history card"""
+    def build():
+        categories = ", ".join(f"{category.replace('_', ' ')} ({count})" for category, count in stats.category_counts[:3])
+        return _split(f"""
+                <div class='metric-card'>
+                    <h4 style='margin: 0 0 10px 0;'>Message History</h4>
+                    <p><strong>Open:</strong> <span style='color: {'#FF4B4B' if stats.open_count >= 3 else '#FF9800' if stats.open_count else '#4CAF50'}'>
+                        {stats.open_count}
+                    </span> of {stats.message_count}
+                    ({stats.pending_count} pending, {stats.in_progress_count} in progress)</p>
+                    <p><strong>Urgency:</strong> avg {stats.avg_urgency:.1f}, max {stats.max_urgency}</p>
+                    <p><strong>Last Contact:</strong> \x00time\x00</p>
+                    <p><strong>Topics:</strong> {categories or 'N/A'}</p>
+                </div>
+                """)
+
+    head, tail = cache.get(('customer_activity', stats), build)
+    return head + relative_time(stats.last_message_at) + tail
+
+
+def message_analysis(cache: FragmentCache, msg: MessageRecord):
+    """Extracted info, urgency score and category for the analysis panel"""
+    def build():
+        score, _ = utils.calculate_urgency_score(msg.message_body)
+        return (
+            utils.extract_customer_info(msg.message_body),
+            score,
+            utils.categorize_message(msg.message_body),
+        )
+
+    return cache.get(('analysis', msg.message_body), build)
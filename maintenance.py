@@ -0,0 +1,369 @@
+"""Scheduled SQLite maintenance.
+
+A :class:`MaintenanceScheduler` keeps the database file in shape over months
+of operation. It checkpoints the WAL so it does not grow without bound,
+prunes old ``change_log`` entries, returns free pages to the filesystem in
+bounded ``incremental_vacuum`` steps, and refreshes planner statistics with
+``PRAGMA optimize`` and ``ANALYZE``.
+
+Tasks only run in low-load windows: the app reports each rerun with
+:meth:`MaintenanceScheduler.record_activity`, every scheduler publishes its
+process's recent rerun count to the ``maintenance_activity`` table, and a
+task waits until the rerun rate summed over all processes drops. Tasks that
+must not be put off forever (the WAL checkpoint above all) run anyway once
+they are ``force_after`` seconds overdue. The schedule lives in the
+``maintenance_runs`` table and each run is claimed with a conditional update,
+so several app processes share one schedule instead of each running every
+task.
+
+Files created before incremental auto-vacuum was enabled are converted by
+the ``enable_incremental_vacuum`` task, a one-off full ``VACUUM`` that blocks
+writers while it runs. It is in ``OFFLINE_TASKS``, which app processes never
+schedule: run ``python maintenance.py --run`` in a maintenance window.
+
+Also usable from the command line (e.g. from cron), from the repository root::
+
+    python maintenance.py           # print database stats
+    python maintenance.py --run     # run every due task now, ignoring load
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection, Engine
+
+from database import MaintenanceActivity, MaintenanceRun
+
+logger = logging.getLogger(__name__)
+
+# A window counts as low load with at most LOW_LOAD_RERUNS reruns, across all processes, in the last LOW_LOAD_WINDOW seconds
+LOW_LOAD_WINDOW = 60.0
+LOW_LOAD_RERUNS = 5
+
+# How often the background thread looks for due tasks (seconds)
+POLL_INTERVAL = 30.0
+
+# Free pages released per incremental_vacuum step
+VACUUM_STEP_PAGES = 2000
+
+# A WAL larger than this is truncated after a checkpoint rather than reused
+WAL_TRUNCATE_BYTES = 64 * 1024 * 1024
+
+# change_log entries kept behind the latest one; older consumers reload instead of replaying
+CHANGE_LOG_RETENTION = 100_000
+
+# Seconds the database figures shown in the app are reused across reruns and sessions
+HEALTH_TTL = 30.0
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+
+def _database_path(conn: Connection) -> Optional[str]:
+    database = conn.engine.url.database
+    if not database or database == ':memory:':
+        return None
+    return os.path.abspath(database)
+
+
+def _pragma(conn: Connection, name: str):
+    return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+
+def checkpoint(conn: Connection) -> str:
+    """Copy the WAL back into the database, truncating the WAL once it has grown large"""
+    path = _database_path(conn)
+    wal_bytes = os.path.getsize(path + '-wal') if path and os.path.exists(path + '-wal') else 0
+    mode = 'TRUNCATE' if wal_bytes > WAL_TRUNCATE_BYTES else 'PASSIVE'
+    busy, log_frames, checkpointed = conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").one()
+    return f"{mode.lower()}: {checkpointed}/{log_frames} frames" + (" (readers busy)" if busy else "")
+
+
+def prune_change_log(conn: Connection) -> str:
+    """Drop change_log entries more than CHANGE_LOG_RETENTION behind the latest"""
+    result = conn.exec_driver_sql(
+        "DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?",
+        (CHANGE_LOG_RETENTION,)
+    )
+    return f"removed {result.rowcount} entries"
+
+
+def incremental_vacuum(conn: Connection) -> str:
+    """Release up to VACUUM_STEP_PAGES free pages to the filesystem"""
+    if _pragma(conn, 'auto_vacuum') != 2:
+        return "skipped: incremental auto-vacuum is off"
+    before = _pragma(conn, 'freelist_count')
+    if before:
+        # The pragma frees one page per step and execute() only steps once; executescript runs it to the end
+        conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+    return f"released {before - _pragma(conn, 'freelist_count')} of {before} free pages"
+
+
+def optimize(conn: Connection) -> str:
+    """Let SQLite re-analyze the tables whose statistics look stale"""
+    conn.exec_driver_sql("PRAGMA optimize")
+    return "ok"
+
+
+def analyze(conn: Connection) -> str:
+    """Rebuild planner statistics for every table and index"""
+    conn.exec_driver_sql("ANALYZE")
+    return "ok"
+
+
+def enable_incremental_vacuum(conn: Connection) -> str:
+    """Convert a file created without auto-vacuum (one full VACUUM)"""
+    if _pragma(conn, 'auto_vacuum') == 2:
+        return "skipped: already incremental"
+    conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.exec_driver_sql("VACUUM")
+    return f"auto_vacuum is now {AUTO_VACUUM_MODES[_pragma(conn, 'auto_vacuum')]}"
+
+
+@dataclass(frozen=True)
+class MaintenanceTask:
+    """A maintenance step and its schedule"""
+    name: str
+    run: Callable[[Connection], str]
+    interval: float  # seconds between runs
+    force_after: Optional[float] = None  # run regardless of load once this overdue; None waits for a quiet window
+
+
+DEFAULT_TASKS = (
+    MaintenanceTask('checkpoint', checkpoint, interval=60.0, force_after=300.0),
+    MaintenanceTask('prune_change_log', prune_change_log, interval=HOUR, force_after=6 * HOUR),
+    MaintenanceTask('incremental_vacuum', incremental_vacuum, interval=300.0, force_after=HOUR),
+    MaintenanceTask('optimize', optimize, interval=HOUR, force_after=6 * HOUR),
+    MaintenanceTask('analyze', analyze, interval=DAY, force_after=7 * DAY),
+)
+
+# Only run from the command line (python maintenance.py --run): a full VACUUM blocks every writer until it ends
+OFFLINE_TASKS = (
+    MaintenanceTask('enable_incremental_vacuum', enable_incremental_vacuum, interval=DAY),
+)
+
+
+def database_stats(engine: Engine) -> dict:
+    """File, WAL, page, freelist and page-cache figures for the database"""
+    with engine.connect() as conn:
+        path = _database_path(conn)
+        page_size = _pragma(conn, 'page_size')
+        page_count = _pragma(conn, 'page_count')
+        freelist_count = _pragma(conn, 'freelist_count')
+        cache_size = _pragma(conn, 'cache_size')
+        analyzed = conn.exec_driver_sql(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).scalar() > 0
+        stats = {
+            'path': path,
+            'file_bytes': os.path.getsize(path) if path and os.path.exists(path) else page_size * page_count,
+            'wal_bytes': os.path.getsize(path + '-wal') if path and os.path.exists(path + '-wal') else 0,
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist_count,
+            'free_ratio': freelist_count / page_count if page_count else 0.0,
+            'journal_mode': _pragma(conn, 'journal_mode'),
+            'auto_vacuum': AUTO_VACUUM_MODES.get(_pragma(conn, 'auto_vacuum'), 'unknown'),
+            # Negative cache_size is in KiB, positive in pages
+            'page_cache_bytes': -cache_size * 1024 if cache_size < 0 else cache_size * page_size,
+            'mmap_bytes': _pragma(conn, 'mmap_size') or 0,
+            'analyzed': analyzed,
+            'change_log_entries': conn.exec_driver_sql("SELECT COUNT(*) FROM change_log").scalar(),
+        }
+    return stats
+
+
+class MaintenanceScheduler:
+    """Runs due maintenance tasks in low-load windows, in a daemon thread or on demand"""
+
+    def __init__(self, engine: Engine, tasks: Tuple[MaintenanceTask, ...] = DEFAULT_TASKS,
+                 low_load_window: float = LOW_LOAD_WINDOW, low_load_reruns: int = LOW_LOAD_RERUNS,
+                 poll_interval: float = POLL_INTERVAL, clock: Callable[[], float] = time.time):
+        self.engine = engine
+        self.tasks = tasks
+        self.low_load_window = low_load_window
+        self.low_load_reruns = low_load_reruns
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._activity = deque()
+        self.process_id = uuid.uuid4().hex  # key of this process's maintenance_activity row
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.history: deque = deque(maxlen=50)  # (task, started, seconds, detail) for this process
+        self._health: Optional[Tuple[float, Tuple[dict, dict]]] = None  # (read at, (stats, last runs))
+
+    def record_activity(self):
+        """Note one unit of user traffic (an app rerun)"""
+        now = self.clock()
+        with self._lock:
+            self._activity.append(now)
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._activity and self._activity[0] < now - self.low_load_window:
+            self._activity.popleft()
+
+    def is_low_load(self) -> bool:
+        """Publish this process's recent reruns, then judge load by the total across all processes"""
+        now = self.clock()
+        with self._lock:
+            self._trim(now)
+            reruns = len(self._activity)
+        with self.engine.begin() as conn:
+            conn.execute(
+                insert(MaintenanceActivity).values(process=self.process_id, reported=now, reruns=reruns)
+                .on_conflict_do_update(index_elements=['process'], set_={'reported': now, 'reruns': reruns})
+            )
+            # Reports from processes that stopped long ago
+            conn.execute(delete(MaintenanceActivity).where(MaintenanceActivity.reported < now - DAY))
+            total = conn.execute(
+                select(func.coalesce(func.sum(MaintenanceActivity.reruns), 0))
+                .where(MaintenanceActivity.reported >= now - self.low_load_window)
+            ).scalar()
+        return total <= self.low_load_reruns
+
+    def last_runs(self) -> dict:
+        """Latest run of each task across all processes, by task name"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(MaintenanceRun.task, MaintenanceRun.last_run, MaintenanceRun.duration, MaintenanceRun.detail)
+            ).all()
+        return {row.task: (row.last_run, row.duration, row.detail) for row in rows}
+
+    def health(self) -> Tuple[dict, dict]:
+        """``(database_stats, last_runs)``, read at most once per HEALTH_TTL seconds"""
+        now = self.clock()
+        with self._lock:
+            if self._health is not None and now - self._health[0] < HEALTH_TTL:
+                return self._health[1]
+        figures = (database_stats(self.engine), self.last_runs())
+        with self._lock:
+            self._health = (now, figures)
+        return figures
+
+    def _claim(self, task: MaintenanceTask, now: float, low_load: bool) -> bool:
+        """Take the task's next run unless another process has run it recently"""
+        with self.engine.begin() as conn:
+            conn.execute(insert(MaintenanceRun).values(task=task.name, last_run=0.0).on_conflict_do_nothing())
+            last_run = conn.execute(
+                select(MaintenanceRun.last_run).where(MaintenanceRun.task == task.name)
+            ).scalar()
+            overdue = now - last_run - task.interval
+            if overdue < 0:
+                return False
+            if not low_load:
+                if task.force_after is None or overdue < task.force_after:
+                    return False
+            claimed = conn.execute(
+                update(MaintenanceRun)
+                .where(MaintenanceRun.task == task.name, MaintenanceRun.last_run == last_run)
+                .values(last_run=now)
+            )
+            return claimed.rowcount == 1
+
+    def run_task(self, task: MaintenanceTask) -> Tuple[float, str]:
+        """Run one task outside a transaction; returns ``(seconds, detail)``"""
+        started = time.perf_counter()
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            detail = task.run(conn)
+        seconds = time.perf_counter() - started
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(MaintenanceRun).where(MaintenanceRun.task == task.name)
+                .values(duration=seconds, detail=detail)
+            )
+        return seconds, detail
+
+    def run_pending(self, force: bool = False) -> List[Tuple[str, float, str]]:
+        """Run every due task the current load allows (all due tasks if ``force``)"""
+        done = []
+        low_load = force or self.is_low_load()
+        for task in self.tasks:
+            now = self.clock()
+            if not self._claim(task, now, low_load):
+                continue
+            try:
+                seconds, detail = self.run_task(task)
+            except Exception as exc:
+                logger.exception("Maintenance task %s failed", task.name)
+                seconds, detail = 0.0, f"failed: {exc}"
+            logger.info("Maintenance %s took %.3fs: %s", task.name, seconds, detail)
+            self.history.append((task.name, now, seconds, detail))
+            done.append((task.name, seconds, detail))
+        if done:
+            with self._lock:
+                self._health = None
+        return done
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Maintenance scheduler error")
+
+    def start(self) -> "MaintenanceScheduler":
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="maintenance", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show database stats and run scheduled maintenance")
+    parser.add_argument('--run', action='store_true',
+                        help="run every due task now, ignoring load, including the one-off VACUUM")
+    parser.add_argument('--new-database-id', action='store_true',
+                        help="stamp a new database id, e.g. after restoring a backup, so no cached results are reused")
+    args = parser.parse_args(argv)
+
+    from database import get_database_id, init_database, stamp_database_id
+    engine = init_database()
+
+    if args.new_database_id:
+        with engine.begin() as conn:
+            stamp_database_id(conn)
+
+    if args.run:
+        scheduler = MaintenanceScheduler(engine, DEFAULT_TASKS + OFFLINE_TASKS)
+        for name, seconds, detail in scheduler.run_pending(force=True):
+            print(f"{name}: {detail} ({seconds * 1000:.0f} ms)")
+
+    stats = database_stats(engine)
+    print(f"database:   {stats['path']}")
+    print(f"file:       {format_bytes(stats['file_bytes'])} ({stats['page_count']} pages of {stats['page_size']} B)")
+    print(f"wal:        {format_bytes(stats['wal_bytes'])} (journal_mode={stats['journal_mode']})")
+    print(f"freelist:   {stats['freelist_count']} pages ({stats['free_ratio']:.1%}, auto_vacuum={stats['auto_vacuum']})")
+    print(f"page cache: {format_bytes(stats['page_cache_bytes'])} per connection, mmap {format_bytes(stats['mmap_bytes'])}")
+    print(f"analyzed:   {'yes' if stats['analyzed'] else 'no'}")
+    print(f"change_log: {stats['change_log_entries']} entries")
+    print(f"id:         {get_database_id(engine)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""In-memory columnar snapshot of the open message queue.
+
+:class:`QueueSnapshot` keeps every unresolved message in preallocated NumPy
+columns; resolved history stays in SQLite, so memory and load time follow the
+open backlog rather than everything ever received. Views that include
+resolved messages (status "all" or "resolved") are not :meth:`covered
+<QueueSnapshot.covers>` and go to ``MessageRepository.get_queue_page``.
+Priority, status, category and agent are dictionary-encoded (categorical
+codes) with one bitmap per distinct value, and bodies are stored
+pre-lowercased. A sidebar filter is then a handful of bitmap ANDs, a
+substring scan over the surviving rows only, and a sort of the matches,
+with no SQLite round trip and no copy of the table.
+
+The snapshot is loaded once and kept current by :meth:`QueueSnapshot.refresh`,
+which replays the ``change_log`` stream written by database triggers and
+re-reads only the rows that changed, dropping those that were resolved. Customer-level sorts look each row's
+customer up in the (cached) ``customer_stats`` column for that sort.
+"""
+import threading
+from dataclasses import replace
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from repository import CUSTOMER_SORT_COLUMNS, UNRESOLVED, MessageRecord, QueueFilter
+
+CATEGORICAL_COLUMNS = ('priority', 'status', 'category', 'agent_id')
+
+# Statuses a repository-backed snapshot holds, i.e. every filter status it can answer besides UNRESOLVED
+OPEN_STATUSES = ('pending', 'in_progress')
+
+# Sort key for customers without stats; sorts after every real value, like SQL's NULL
+_NO_SIGNAL = np.iinfo(np.int64).min + 1
+
+
+def _signal_value(value) -> int:
+    if value is None:
+        return _NO_SIGNAL
+    if isinstance(value, datetime):
+        return int(np.datetime64(value, 'ns').astype(np.int64))
+    return int(value)
+
+
+class QueueSnapshot:
+    """Columnar, bitmap-indexed copy of the unresolved ``customer_messages`` rows"""
+
+    def __init__(self, repository=None, capacity: int = 1024):
+        self.repository = repository
+        self.open_only = repository is not None  # detached snapshots hold whatever they were given
+        self._lock = threading.RLock()
+        self._signals = None  # (sort, loaded signals, user ids, values) of the last customer sort
+        self._reset(capacity)
+        if repository is not None:
+            self.reload()
+
+    def _reset(self, capacity: int):
+        self.seq = 0  # last change_log sequence applied
+        self._size = 0
+        self._live = 0
+        self._capacity = capacity
+        self._rows: Dict[int, int] = {}  # message id -> row
+        self._records = np.empty(capacity, dtype=object)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._urgency = np.zeros(capacity, dtype=np.int64)
+        self._timestamps = np.zeros(capacity, dtype='datetime64[ns]')
+        self._cluster_keys = np.zeros(capacity, dtype=np.int64)
+        self._user_ids = np.empty(capacity, dtype=object)  # str(user_id), for search
+        self._user_keys = np.zeros(capacity, dtype=np.int64)
+        self._bodies = np.empty(capacity, dtype=object)  # lowercased message bodies
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._codes = {column: np.full(capacity, -1, dtype=np.int32) for column in CATEGORICAL_COLUMNS}
+        self._categories: Dict[str, List[str]] = {column: [] for column in CATEGORICAL_COLUMNS}
+        self._lookup: Dict[str, Dict[str, int]] = {column: {} for column in CATEGORICAL_COLUMNS}
+        self._bitmaps: Dict[str, List[np.ndarray]] = {column: [] for column in CATEGORICAL_COLUMNS}
+
+    def __len__(self) -> int:
+        return self._live
+
+    # ------------------------------------------------------------------
+    # Loading and change stream
+    # ------------------------------------------------------------------
+
+    def covers(self, filters: QueueFilter) -> bool:
+        """Whether :meth:`query` can answer ``filters``; resolved messages are only in the database"""
+        return not self.open_only or filters.status == UNRESOLVED or filters.status in OPEN_STATUSES
+
+    def reload(self):
+        """Rebuild from the database's unresolved messages"""
+        with self._lock:
+            # Read the log position first so nothing written during the load is missed
+            seq = self.repository.get_change_seq()
+            self._reset(self._capacity)
+            for batch in self.repository.iter_messages(QueueFilter(status=UNRESOLVED)):
+                for record in batch:
+                    self.upsert(record)
+            self.seq = seq
+
+    def refresh(self) -> int:
+        """Apply changes logged since the last refresh; returns the number of rows touched"""
+        with self._lock:
+            changes = self.repository.get_changes('customer_messages', self.seq)
+            if changes is None:
+                self.reload()
+                return self._live
+            latest, message_ids = changes
+            if message_ids:
+                records = self.repository.get_messages(message_ids)
+                for record in records:
+                    if record.status == 'resolved':
+                        self.delete(record.id)
+                    else:
+                        self.upsert(record)
+                found = {record.id for record in records}
+                for message_id in message_ids:
+                    if message_id not in found:
+                        self.delete(message_id)
+            self.seq = latest
+            return len(message_ids)
+
+    @classmethod
+    def from_records(cls, records: Sequence[MessageRecord]) -> "QueueSnapshot":
+        """Build a detached snapshot (no repository, no refresh) from records"""
+        snapshot = cls(capacity=max(16, len(records)))
+        for record in records:
+            snapshot.upsert(record)
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # Row maintenance
+    # ------------------------------------------------------------------
+
+    def upsert(self, record: MessageRecord):
+        """Insert or overwrite one message"""
+        with self._lock:
+            row = self._rows.get(record.id)
+            if row is None:
+                if self._size == self._capacity:
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._live += 1
+                self._rows[record.id] = row
+                self._alive[row] = True
+            else:
+                self._clear_bits(row)
+
+            self._records[row] = record
+            self._ids[row] = record.id
+            self._urgency[row] = record.urgency_score or 0
+            self._timestamps[row] = np.datetime64(record.timestamp, 'ns')
+            self._cluster_keys[row] = record.cluster_id if record.cluster_id is not None else record.id
+            self._user_ids[row] = str(record.user_id)
+            self._user_keys[row] = record.user_id
+            self._bodies[row] = record.message_body.lower()
+            for column in CATEGORICAL_COLUMNS:
+                code = self._encode(column, getattr(record, column))
+                self._codes[column][row] = code
+                if code >= 0:
+                    self._bitmaps[column][code][row] = True
+
+    def delete(self, message_id: int):
+        """Drop a message; its row is reclaimed on the next compaction"""
+        with self._lock:
+            row = self._rows.pop(message_id, None)
+            if row is None:
+                return
+            self._clear_bits(row)
+            self._alive[row] = False
+            self._records[row] = None
+            self._live -= 1
+            if self._live < self._size // 2:
+                self._compact()
+
+    def _encode(self, column: str, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self._lookup[column].get(value)
+        if code is None:
+            code = len(self._categories[column])
+            self._lookup[column][value] = code
+            self._categories[column].append(value)
+            self._bitmaps[column].append(np.zeros(self._capacity, dtype=bool))
+        return code
+
+    def _clear_bits(self, row: int):
+        for column in CATEGORICAL_COLUMNS:
+            code = self._codes[column][row]
+            if code >= 0:
+                self._bitmaps[column][code][row] = False
+
+    def _grow(self):
+        capacity = self._capacity * 2
+
+        def grown(array, fill=0):
+            bigger = np.full(capacity, fill, dtype=array.dtype) if array.dtype != object \
+                else np.empty(capacity, dtype=object)
+            bigger[:self._capacity] = array
+            return bigger
+
+        self._records = grown(self._records)
+        self._ids = grown(self._ids)
+        self._urgency = grown(self._urgency)
+        self._timestamps = grown(self._timestamps, np.datetime64(0, 'ns'))
+        self._cluster_keys = grown(self._cluster_keys)
+        self._user_ids = grown(self._user_ids)
+        self._user_keys = grown(self._user_keys)
+        self._bodies = grown(self._bodies)
+        self._alive = grown(self._alive, False)
+        for column in CATEGORICAL_COLUMNS:
+            self._codes[column] = grown(self._codes[column], -1)
+            self._bitmaps[column] = [grown(bitmap, False) for bitmap in self._bitmaps[column]]
+        self._capacity = capacity
+
+    def _compact(self):
+        records = [record for record in self._records[:self._size] if record is not None]
+        seq = self.seq
+        self._reset(max(1024, self._capacity // 2))
+        for record in records:
+            self.upsert(record)
+        self.seq = seq
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _bitmap(self, column: str, value: str) -> np.ndarray:
+        code = self._lookup[column].get(value)
+        if code is None:
+            return np.zeros(self._size, dtype=bool)
+        return self._bitmaps[column][code][:self._size]
+
+    def _customer_signal(self, sort: str, rows: np.ndarray) -> np.ndarray:
+        """Each row's customer value for a customer sort, as int64 (detached snapshots have none)"""
+        if self.repository is None:
+            return np.full(len(rows), _NO_SIGNAL, dtype=np.int64)
+        signals = self.repository.get_customer_signals(sort)
+        if self._signals is None or self._signals[0] != sort or self._signals[1] is not signals:
+            users = np.fromiter((user_id for user_id, _ in signals), dtype=np.int64, count=len(signals))
+            values = np.fromiter((_signal_value(value) for _, value in signals), dtype=np.int64, count=len(signals))
+            self._signals = (sort, signals, users, values)
+        _, _, users, values = self._signals
+        if not len(users):
+            return np.full(len(rows), _NO_SIGNAL, dtype=np.int64)
+
+        keys = self._user_keys[rows]
+        positions = np.minimum(np.searchsorted(users, keys), len(users) - 1)
+        return np.where(users[positions] == keys, values[positions], _NO_SIGNAL)
+
+    def match(self, filters: QueueFilter) -> np.ndarray:
+        """Rows matching the filters, in queue order (most urgent, then newest, first, or by a customer sort)"""
+        with self._lock:
+            mask = self._alive[:self._size].copy()
+            if filters.priority != "all":
+                mask &= self._bitmap('priority', filters.priority)
+            if filters.status == UNRESOLVED:
+                mask &= ~self._bitmap('status', 'resolved')
+            elif filters.status != "all":
+                mask &= self._bitmap('status', filters.status)
+            if filters.category != "all":
+                mask &= self._bitmap('category', filters.category)
+            if filters.agent_id is not None:
+                mask &= self._bitmap('agent_id', filters.agent_id)
+            if filters.since is not None:
+                mask &= self._timestamps[:self._size] >= np.datetime64(filters.since, 'ns')
+            if filters.until is not None:
+                mask &= self._timestamps[:self._size] < np.datetime64(filters.until, 'ns')
+            rows = np.flatnonzero(mask)
+
+            if filters.search_query and len(rows):
+                query = filters.search_query.lower()
+                hits = [query in body for body in self._bodies[rows].tolist()]
+                if query.isdigit():  # user ids are digits only; skip the second scan otherwise
+                    hits = [hit or query in user_id for hit, user_id in zip(hits, self._user_ids[rows].tolist())]
+                rows = rows[np.array(hits, dtype=bool)]
+
+            keys = [-self._ids[rows], -self._timestamps[rows].astype(np.int64), -self._urgency[rows]]
+            if filters.sort in CUSTOMER_SORT_COLUMNS:
+                keys.append(-self._customer_signal(filters.sort, rows))
+            return rows[np.lexsort(keys)]
+
+    def query(self, filters: QueueFilter) -> Tuple[MessageRecord, ...]:
+        """Same contract as MessageRepository.get_queue_page, answered from memory"""
+        with self._lock:
+            rows = self.match(filters)
+            if not filters.group_clusters:
+                return tuple(self._records[rows[:filters.limit]])
+
+            # First row of each cluster in queue order is its most urgent member
+            keys = self._cluster_keys[rows]
+            _, first, sizes = np.unique(keys, return_index=True, return_counts=True)
+            order = np.argsort(first)[:filters.limit]
+            return tuple(
+                replace(self._records[rows[first[i]]], cluster_size=int(sizes[i])) if sizes[i] > 1
+                else self._records[rows[first[i]]]
+                for i in order
+            )
+
+    def to_frame(self, rows: Optional[np.ndarray] = None):
+        """Materialise rows (default: all live rows) as a DataFrame with categorical columns"""
+        import pandas as pd
+
+        with self._lock:
+            if rows is None:
+                rows = np.flatnonzero(self._alive[:self._size])
+            records = self._records[rows]
+            frame = pd.DataFrame({
+                'id': self._ids[rows],
+                'user_id': np.fromiter((r.user_id for r in records), dtype=np.int64, count=len(rows)),
+                'timestamp': self._timestamps[rows],
+                'message_body': [r.message_body for r in records],
+                'urgency_score': self._urgency[rows],
+                'response': [r.response for r in records],
+                'cluster_id': self._cluster_keys[rows],
+            })
+            for column in CATEGORICAL_COLUMNS:
+                frame[column] = pd.Categorical.from_codes(
+                    self._codes[column][rows], categories=self._categories[column]
+                )
+            return frame
@@ -0,0 +1,220 @@
+"""Canned-response recommender.
+
+A TF-IDF index over template titles, texts and categories, stored as
+term postings in CSR form: ``indptr``/``rows``/``tf`` NumPy arrays where
+term ``t`` owns ``rows[indptr[t]:indptr[t + 1]]``, the templates it occurs
+in. Memory grows with the number of (term, template) pairs, not with
+templates x vocabulary. Messages are turned into sparse term vectors; only
+the postings of terms that actually occur are gathered, and a whole queue
+page is scored with a single matrix product. New templates are merged into
+the postings without touching the existing ones' tokens; the IDF vector and
+template norms are then recomputed in one O(postings) vectorised pass.
+"""
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from repository import MessageRecord, TemplateRecord
+
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have i if in is it its me my of on or our please
+so that the this to u ur was we were what when why will with you your
+""".split())
+
+# Matching categories count like this many shared words
+CATEGORY_WEIGHT = 2.0
+
+# Pre-ranked results kept before the memo is dropped and rebuilt on demand
+MAX_RANKED = 10000
+
+
+def tokenize(text: str, category: Optional[str] = None) -> Dict[str, float]:
+    """Term counts for a text; the category becomes a weighted pseudo-term"""
+    counts: Dict[str, float] = {}
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        if word in STOP_WORDS or len(word) < 2:
+            continue
+        counts[word] = counts.get(word, 0.0) + 1.0
+    if category:
+        key = f"__category__{category}"
+        counts[key] = counts.get(key, 0.0) + CATEGORY_WEIGHT
+    return counts
+
+
+class TemplateRecommender:
+    """Ranks canned responses for a message; one instance is shared per process"""
+
+    def __init__(self, templates: Iterable[TemplateRecord] = ()):
+        self._lock = threading.Lock()
+        self._reset()
+        self.sync(templates)
+
+    def _reset(self):
+        self.templates: List[TemplateRecord] = []
+        self._ids: Dict[int, int] = {}  # template id -> row
+        self._vocab: Dict[str, int] = {}
+        # Term postings in CSR form; templates appear in row order within each term
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int32)  # template row of each posting
+        self._terms = np.zeros(0, dtype=np.int32)  # term of each posting, expanded from indptr
+        self._tf = np.zeros(0, dtype=np.float32)  # log-scaled term frequency of each posting
+        self._weights = np.zeros(0, dtype=np.float32)  # L2-normalised tf-idf of each posting
+        self._df = np.zeros(0, dtype=np.float32)
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._ranked: Dict[Tuple[int, str, Optional[str], int], List[Tuple[int, float]]] = {}
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+
+    def sync(self, templates: Iterable[TemplateRecord]):
+        """Bring the index in line with the current template list.
+
+        Unknown templates are added incrementally; a full rebuild only happens
+        when templates have disappeared.
+        """
+        templates = list(templates)
+        with self._lock:
+            current = {template.id for template in templates}
+            if any(template_id not in current for template_id in self._ids):
+                self._reset()
+            new = [template for template in templates if template.id not in self._ids]
+            # Metadata such as use_count changes without touching the index
+            for template in templates:
+                row = self._ids.get(template.id)
+                if row is not None:
+                    self.templates[row] = template
+            if new:
+                self._add(new)
+
+    def add_template(self, template: TemplateRecord):
+        """Index one new template"""
+        with self._lock:
+            if template.id not in self._ids:
+                self._add([template])
+
+    def _add(self, templates: Sequence[TemplateRecord]):
+        first = len(self.templates)
+        terms, rows, tf = [], [], []
+        for offset, template in enumerate(templates):
+            tokens = tokenize(f"{template.title} {template.response_text}", template.category)
+            for term in tokens:
+                if term not in self._vocab:
+                    self._vocab[term] = len(self._vocab)
+                terms.append(self._vocab[term])
+            rows.extend([first + offset] * len(tokens))
+            tf.extend(tokens.values())
+
+        for offset, template in enumerate(templates):
+            self._ids[template.id] = first + offset
+            self.templates.append(template)
+
+        self._merge(np.asarray(terms, dtype=np.int32), np.asarray(rows, dtype=np.int32),
+                    1.0 + np.log(np.asarray(tf, dtype=np.float32)))
+        self._df = np.diff(self._indptr).astype(np.float32)
+        self._idf = (np.log((1.0 + len(self.templates)) / (1.0 + self._df)) + 1.0).astype(np.float32)
+        # The template count is part of every IDF, so every norm moves with it
+        weights = self._tf * self._idf[self._terms]
+        self._norms = np.sqrt(np.bincount(self._rows, weights * weights,
+                                          minlength=len(self.templates))).astype(np.float32)
+        self._weights = weights / np.maximum(self._norms[self._rows], 1e-12)
+        self._ranked.clear()
+
+    def _merge(self, terms: np.ndarray, rows: np.ndarray, tf: np.ndarray):
+        """Append postings for new template rows, keeping each term's postings contiguous"""
+        old_counts = np.zeros(len(self._vocab), dtype=np.int64)
+        old_counts[:len(self._indptr) - 1] = np.diff(self._indptr)
+        new_counts = np.bincount(terms, minlength=len(self._vocab))
+        indptr = np.zeros(len(self._vocab) + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=indptr[1:])
+
+        # Existing postings shift right by the new postings of the terms before them
+        old_positions = np.arange(len(self._rows), dtype=np.int64)
+        old_targets = indptr[self._terms] + old_positions - self._indptr[self._terms]
+        # New rows are higher than any existing one, so they go at the end of each term
+        order = np.argsort(terms, kind='stable')
+        terms, rows, tf = terms[order], rows[order], tf[order]
+        rank = np.arange(len(terms), dtype=np.int64) - np.searchsorted(terms, terms)
+        new_targets = indptr[terms] + old_counts[terms] + rank
+
+        for name, new in (('_rows', rows), ('_terms', terms), ('_tf', tf)):
+            merged = np.empty(indptr[-1], dtype=new.dtype)
+            merged[old_targets] = getattr(self, name)
+            merged[new_targets] = new
+            setattr(self, name, merged)
+        self._indptr = indptr
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def _query_vectors(self, messages: Sequence[MessageRecord]):
+        """COO representation (row, vocabulary index, weight) of the messages' tf-idf vectors"""
+        rows, cols, values = [], [], []
+        for row, message in enumerate(messages):
+            tokens = tokenize(message.message_body, message.category)
+            known = [(self._vocab[term], count) for term, count in tokens.items() if term in self._vocab]
+            if not known:
+                continue
+            indices = np.fromiter((index for index, _ in known), dtype=np.int64, count=len(known))
+            counts = np.fromiter((count for _, count in known), dtype=np.float32, count=len(known))
+            weights = (1.0 + np.log(counts)) * self._idf[indices]
+            weights /= np.linalg.norm(weights)
+            rows.extend([row] * len(known))
+            cols.append(indices)
+            values.append(weights)
+        if not cols:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.asarray(rows, dtype=np.int64), np.concatenate(cols), np.concatenate(values)
+
+    def _score(self, messages: Sequence[MessageRecord]) -> np.ndarray:
+        """Cosine similarity matrix, one row per message and one column per template"""
+        rows, cols, values = self._query_vectors(messages)
+        if not len(rows):
+            return np.zeros((len(messages), len(self.templates)), dtype=np.float32)
+        # Densify only the columns the queries use and those terms' postings, then one matrix product
+        terms, positions = np.unique(cols, return_inverse=True)
+        queries = np.zeros((len(messages), len(terms)), dtype=np.float32)
+        queries[rows, positions] = values
+        starts, counts = self._indptr[terms], np.diff(self._indptr)[terms]
+        postings = np.arange(counts.sum(), dtype=np.int64) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        index = np.zeros((len(terms), len(self.templates)), dtype=np.float32)
+        index[np.repeat(np.arange(len(terms)), counts), self._rows[postings]] = self._weights[postings]
+        return queries @ index
+
+    def _top_k(self, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # Best score first; ties go to the more used template
+        ordered = sorted(candidates, key=lambda row: (-scores[row], -self.templates[row].use_count))
+        return [(int(row), float(scores[row])) for row in ordered if scores[row] > 0]
+
+    def recommend(self, message: MessageRecord, k: int = 3) -> List[Tuple[TemplateRecord, float]]:
+        """Top-k templates for a message, best first, with their cosine scores"""
+        return self.recommend_batch([message], k)[message.id]
+
+    def recommend_batch(self, messages: Sequence[MessageRecord], k: int = 3) -> Dict[int, List[Tuple[TemplateRecord, float]]]:
+        """Rank templates for a whole queue page in one vectorised pass.
+
+        Results are memoised per (message id, body, category, k) until the index
+        changes, so a later :meth:`recommend` for a pre-ranked message is a
+        dictionary lookup.
+        """
+        with self._lock:
+            pending = [m for m in messages if (m.id, m.message_body, m.category, k) not in self._ranked]
+            if pending and self.templates:
+                if len(self._ranked) + len(pending) > MAX_RANKED:
+                    self._ranked.clear()
+                scores = self._score(pending)
+                for message, row in zip(pending, scores):
+                    self._ranked[(message.id, message.message_body, message.category, k)] = self._top_k(row, k)
+            results = {}
+            for message in messages:
+                ranked = self._ranked.get((message.id, message.message_body, message.category, k), [])
+                results[message.id] = [(self.templates[row], score) for row, score in ranked]
+            return results
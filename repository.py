@@ -0,0 +1,1011 @@
+"""Data-access layer for the CS messaging app.
+
+Every query and write the UI needs goes through :class:`MessageRepository`.
+Results are returned as immutable records (never live ORM objects) so they can
+be cached by the process-wide :class:`ReadModel` and shared safely between all
+Streamlit sessions served by the same process.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import String, bindparam, desc, func, literal, or_, select, union_all, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import sessionmaker
+
+from database import (
+    CannedResponse, ChangeLog, CustomerMessage, CustomerProfile, CustomerStats, OutboundMessage, get_database_id,
+    get_engine
+)
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_STATUSES = ["pending", "in_progress", "resolved"]
+
+# Pseudo-status accepted by QueueFilter: anything not yet resolved.
+UNRESOLVED = "unresolved"
+
+# Ids per set-based UPDATE; keeps each statement well under SQLite's bound-parameter limit.
+BULK_BATCH_SIZE = 500
+
+# Queue orders: by message urgency, or first by a customer-level signal from customer_stats
+QUEUE_SORTS = ["urgency", "customer_backlog", "customer_urgency", "customer_recent"]
+CUSTOMER_SORT_COLUMNS = {
+    "customer_backlog": CustomerStats.open_count,
+    "customer_urgency": CustomerStats.max_urgency,
+    "customer_recent": CustomerStats.last_message_at,
+}
+
+# Read-model tags, one per table family. A write invalidates only the tags it touches.
+MESSAGES = "messages"
+TEMPLATES = "templates"
+PROFILES = "profiles"
+OUTBOX = "outbox"
+
+# Table behind each tag; its change_log counter versions the tag's cache entries
+TAG_TABLES = {
+    MESSAGES: 'customer_messages',
+    TEMPLATES: 'canned_responses',
+    PROFILES: 'customer_profiles',
+    OUTBOX: 'outbound_messages',
+}
+
+# Seconds a process may serve entries before re-reading the change counters
+VERSION_TTL = 1.0
+
+# Outbox row lifecycle: queued -> sending -> delivered, or back to queued for a retry, or failed
+OUTBOX_STATUSES = ["queued", "sending", "delivered", "failed"]
+
+
+def response_digest(response_text: str) -> str:
+    """Short content hash used in outbox idempotency keys"""
+    return hashlib.sha256(response_text.encode('utf-8')).hexdigest()[:16]
+
+
+def idempotency_key(message_id: int, response_text: str) -> str:
+    """Outbox key: the same response to the same message is only ever delivered once"""
+    return f"{message_id}:{response_digest(response_text)}"
+
+
+@dataclass(frozen=True)
+class MessageRecord:
+    """Immutable snapshot of a customer message and its response"""
+    id: int
+    user_id: int
+    timestamp: datetime
+    message_body: str
+    agent_id: Optional[str]
+    response: Optional[str]
+    response_timestamp: Optional[datetime]
+    status: str
+    urgency_score: int
+    priority: str
+    category: Optional[str]
+    cluster_id: Optional[int] = None
+    cluster_size: int = 1  # only filled in on grouped queue pages
+
+    @classmethod
+    def from_row(cls, row: CustomerMessage) -> "MessageRecord":
+        return cls(
+            id=row.id,
+            user_id=row.user_id,
+            timestamp=row.timestamp,
+            message_body=row.message_body,
+            agent_id=row.agent_id,
+            response=row.response,
+            response_timestamp=row.response_timestamp,
+            status=row.status,
+            urgency_score=row.urgency_score,
+            priority=row.priority,
+            category=row.category,
+            cluster_id=row.cluster_id,
+        )
+
+
+@dataclass(frozen=True)
+class TemplateRecord:
+    """Immutable snapshot of a canned response"""
+    id: int
+    title: str
+    response_text: str
+    category: Optional[str]
+    use_count: int
+
+    @classmethod
+    def from_row(cls, row: CannedResponse) -> "TemplateRecord":
+        return cls(
+            id=row.id,
+            title=row.title,
+            response_text=row.response_text,
+            category=row.category,
+            use_count=row.use_count or 0,
+        )
+
+
+@dataclass(frozen=True)
+class ProfileRecord:
+    """Immutable snapshot of a customer profile"""
+    user_id: int
+    name: Optional[str]
+    email: Optional[str]
+    phone: Optional[str]
+    last_loan_amount: Optional[int]
+    last_loan_date: Optional[datetime]
+    repayment_history: str
+    total_loans: int
+    total_repaid: int
+    credit_score: int
+
+    @classmethod
+    def from_row(cls, row: CustomerProfile) -> "ProfileRecord":
+        return cls(
+            user_id=row.user_id,
+            name=row.name,
+            email=row.email,
+            phone=row.phone,
+            last_loan_amount=row.last_loan_amount,
+            last_loan_date=row.last_loan_date,
+            repayment_history=row.repayment_history,
+            total_loans=row.total_loans,
+            total_repaid=row.total_repaid,
+            credit_score=row.credit_score,
+        )
+
+
+@dataclass(frozen=True)
+class CustomerStatsRecord:
+    """Immutable snapshot of a customer's message aggregates"""
+    user_id: int
+    message_count: int
+    open_count: int
+    pending_count: int
+    in_progress_count: int
+    resolved_count: int
+    urgency_sum: int
+    max_urgency: int
+    first_message_at: Optional[datetime]
+    last_message_at: Optional[datetime]
+    category_counts: Tuple[Tuple[str, int], ...]  # most frequent first
+
+    @property
+    def avg_urgency(self) -> float:
+        return self.urgency_sum / self.message_count if self.message_count else 0.0
+
+    @classmethod
+    def from_row(cls, row: CustomerStats) -> "CustomerStatsRecord":
+        categories = json.loads(row.category_counts or '{}')
+        return cls(
+            user_id=row.user_id,
+            message_count=row.message_count,
+            open_count=row.open_count,
+            pending_count=row.pending_count,
+            in_progress_count=row.in_progress_count,
+            resolved_count=row.resolved_count,
+            urgency_sum=row.urgency_sum,
+            max_urgency=row.max_urgency,
+            first_message_at=row.first_message_at,
+            last_message_at=row.last_message_at,
+            category_counts=tuple(sorted(categories.items(), key=lambda item: (-item[1], item[0]))),
+        )
+
+
+@dataclass(frozen=True)
+class OutboundRecord:
+    """Immutable snapshot of an outbox row"""
+    id: int
+    message_id: int
+    user_id: int
+    body: str
+    idempotency_key: str
+    status: str
+    attempts: int
+    next_attempt_at: datetime
+    last_error: Optional[str]
+    gateway_message_id: Optional[str]
+    created_at: datetime
+    delivered_at: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, row) -> "OutboundRecord":
+        return cls(
+            id=row.id,
+            message_id=row.message_id,
+            user_id=row.user_id,
+            body=row.body,
+            idempotency_key=row.idempotency_key,
+            status=row.status,
+            attempts=row.attempts,
+            next_attempt_at=row.next_attempt_at,
+            last_error=row.last_error,
+            gateway_message_id=row.gateway_message_id,
+            created_at=row.created_at,
+            delivered_at=row.delivered_at,
+        )
+
+
+@dataclass(frozen=True)
+class MessageStats:
+    """Headline counters shown in the metrics row"""
+    total: int
+    pending: int
+    high_priority: int
+    today: int
+
+
+@dataclass(frozen=True)
+class BulkUpdateResult:
+    """Outcome of a bulk status change"""
+    updated: List[int]  # ids changed, ascending
+    skipped: int = 0  # requested messages left alone: missing, or already resolved or answered
+
+
+@dataclass(frozen=True)
+class QueueFilter:
+    """Sidebar filter state; hashable so it can be used as a cache key"""
+    search_query: str = ""
+    priority: str = "all"
+    status: str = "all"
+    category: str = "all"
+    agent_id: Optional[str] = None
+    group_clusters: bool = False  # one row per near-duplicate cluster
+    limit: int = 50
+    since: Optional[datetime] = None  # received at or after
+    until: Optional[datetime] = None  # received before
+    sort: str = "urgency"  # one of QUEUE_SORTS
+
+
+def queue_order(sort: str = "urgency") -> tuple:
+    """ORDER BY for the queue; customer sorts need customer_stats joined on user_id"""
+    order = (desc(CustomerMessage.urgency_score), desc(CustomerMessage.timestamp), desc(CustomerMessage.id))
+    column = CUSTOMER_SORT_COLUMNS.get(sort)
+    return order if column is None else (desc(column),) + order
+
+
+def filter_conditions(filters: QueueFilter) -> list:
+    """SQL conditions equivalent to the queue filters (``limit`` is not applied)"""
+    conditions = []
+    if filters.priority != "all":
+        conditions.append(CustomerMessage.priority == filters.priority)
+    if filters.status == UNRESOLVED:
+        conditions.append(CustomerMessage.status != 'resolved')
+    elif filters.status != "all":
+        conditions.append(CustomerMessage.status == filters.status)
+    if filters.category != "all":
+        conditions.append(CustomerMessage.category == filters.category)
+    if filters.agent_id is not None:
+        conditions.append(CustomerMessage.agent_id == filters.agent_id)
+    if filters.since is not None:
+        conditions.append(CustomerMessage.timestamp >= filters.since)
+    if filters.until is not None:
+        conditions.append(CustomerMessage.timestamp < filters.until)
+    if filters.search_query:
+        # Escaped so "%" and "_" match literally, like the in-memory snapshot's substring search
+        conditions.append(
+            or_(
+                CustomerMessage.message_body.contains(filters.search_query, autoescape=True),
+                CustomerMessage.user_id.cast(String).contains(filters.search_query, autoescape=True)
+            )
+        )
+    return conditions
+
+
+def outbound_due(now: datetime) -> tuple:
+    """Outbox rows ready to send: queued and due, or sending with an expired lease"""
+    return OutboundMessage.status.in_(("queued", "sending")), OutboundMessage.next_attempt_at <= now
+
+
+class ReadModel:
+    """Process-wide cache of read results with tag-based invalidation.
+
+    Each entry is stored under one tag. ``invalidate(tag)`` drops the tag's
+    entries and bumps its version; a loader that started before the bump does
+    not publish its (possibly stale) result, so readers never see data older
+    than the last write they could have observed.
+
+    Given a ``versions`` source (``{tag: change counter}`` read from the
+    database), entries are also stamped with their tag's counter and dropped
+    once it moves, so writes made by other processes are picked up too. The
+    counters are re-read at most every ``version_ttl`` seconds, and right
+    after a local invalidation. A ``shared`` cache (see
+    :class:`shared_cache.SharedCache`) is then consulted on local misses and
+    filled after loads, so processes on one host share query results.
+    """
+
+    def __init__(self, versions: Optional[Callable[[], Dict[str, int]]] = None,
+                 shared=None, version_ttl: float = VERSION_TTL, database_id: Optional[str] = None):
+        if shared is not None and (versions is None or not database_id):
+            raise ValueError("A shared cache needs a versions source and a database id to key its entries")
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[Hashable, Tuple[int, object]]] = {}
+        self._versions: Dict[str, int] = {}
+        self._version_source = versions
+        self._version_ttl = version_ttl
+        self._db_versions: Dict[str, int] = {}
+        self._db_versions_read = float('-inf')
+        self.shared = shared
+        self.database_id = database_id
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _db_version(self, tag: str) -> int:
+        if self._version_source is None:
+            return 0
+        now = time.monotonic()
+        if now - self._db_versions_read > self._version_ttl:
+            versions = self._version_source()
+            with self._lock:
+                self._db_versions = versions
+                self._db_versions_read = now
+        return self._db_versions.get(tag, 0)
+
+    def get(self, tag: str, key: Hashable, loader: Callable[[], object]):
+        """Return the cached value for ``key``, loading it on a miss"""
+        db_version = self._db_version(tag)
+        with self._lock:
+            entry = self._entries.setdefault(tag, {}).get(key)
+            if entry is not None and entry[0] == db_version:
+                self.hits += 1
+                return entry[1]
+            version = self._versions.get(tag, 0)
+
+        if self.shared is not None:
+            try:
+                found, value = self.shared.lookup(self.database_id, tag, db_version, key)
+            except Exception:
+                # The shared tier is only an optimisation: a locked, corrupt or unwritable cache is a miss
+                logger.warning("Shared cache lookup failed for %s", tag, exc_info=True)
+                found, value = False, None
+            if found:
+                with self._lock:
+                    self.shared_hits += 1
+                    if self._versions.get(tag, 0) == version:
+                        self._entries.setdefault(tag, {})[key] = (db_version, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        value = loader()
+
+        with self._lock:
+            fresh = self._versions.get(tag, 0) == version
+            if fresh:
+                self._entries.setdefault(tag, {})[key] = (db_version, value)
+        if fresh and self.shared is not None:
+            try:
+                self.shared.publish(self.database_id, tag, db_version, key, value)
+            except Exception:
+                logger.warning("Shared cache publish failed for %s", tag, exc_info=True)
+        return value
+
+    def invalidate(self, *tags: str):
+        """Drop every cached entry under the given tags"""
+        with self._lock:
+            for tag in tags:
+                self._entries.pop(tag, None)
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+            # The write is committed; the next read picks up its counter
+            self._db_versions_read = float('-inf')
+
+    def clear(self):
+        """Drop everything"""
+        with self._lock:
+            for tag in list(self._entries):
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+            self._entries.clear()
+            self._db_versions_read = float('-inf')
+
+    def stats(self) -> Dict[str, float]:
+        """Lookup counters and hit ratios (local, and local plus shared)"""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'local_hit_ratio': self.hits / lookups if lookups else 0.0,
+            'hit_ratio': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+
+class MessageRepository:
+    """Typed queries and transitions over the messaging database"""
+
+    def __init__(self, engine=None, read_model: Optional[ReadModel] = None, shared_cache=None):
+        self.engine = engine if engine is not None else get_engine()
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        if read_model is None:
+            database_id = get_database_id(self.engine) if shared_cache is not None else None
+            read_model = ReadModel(versions=self.get_table_versions, shared=shared_cache, database_id=database_id)
+        self.read_model = read_model
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get_queue_page(self, filters: QueueFilter) -> Tuple[MessageRecord, ...]:
+        """Get the most urgent messages matching the filters"""
+        return self.read_model.get(MESSAGES, ("queue", filters), lambda: self._load_queue_page(filters))
+
+    def get_message_stats(self) -> MessageStats:
+        """Get message statistics"""
+        today = date.today()
+        return self.read_model.get(MESSAGES, ("stats", today), lambda: self._load_message_stats(today))
+
+    def get_thread(self, message_id: int) -> Optional[MessageRecord]:
+        """Get a single message together with its response"""
+        return self.read_model.get(MESSAGES, ("thread", message_id), lambda: self._load_thread(message_id))
+
+    def get_customer_profile(self, user_id: int) -> Optional[ProfileRecord]:
+        """Get customer profile information"""
+        return self.read_model.get(PROFILES, ("profile", user_id), lambda: self._load_profile(user_id))
+
+    def get_customer_stats(self, user_id: int) -> Optional[CustomerStatsRecord]:
+        """Get a customer's message aggregates (one primary-key read)"""
+        return self.read_model.get(MESSAGES, ("customer_stats", user_id), lambda: self._load_customer_stats(user_id))
+
+    def get_customer_signals(self, sort: str) -> Tuple[Tuple[int, object], ...]:
+        """``(user_id, value)`` of a customer sort's column for every customer, by user id"""
+        return self.read_model.get(MESSAGES, ("customer_signals", sort), lambda: self._load_customer_signals(sort))
+
+    def get_canned_responses(self) -> Tuple[TemplateRecord, ...]:
+        """Get all canned responses, most used first"""
+        return self.read_model.get(TEMPLATES, ("templates",), self._load_canned_responses)
+
+    def get_deliveries(self, message_id: int) -> Tuple[OutboundRecord, ...]:
+        """Get the outbox rows for a message's responses, oldest first"""
+        return self.read_model.get(OUTBOX, ("deliveries", message_id), lambda: self._load_deliveries(message_id))
+
+    def count_messages(self, filters: QueueFilter) -> int:
+        """Count every message matching the filters, ignoring ``limit``"""
+        return self.read_model.get(MESSAGES, ("count", filters), lambda: self._load_message_count(filters))
+
+    def get_message_ids(self, filters: QueueFilter) -> List[int]:
+        """Get the ids of every message matching the filters, ignoring ``limit`` (uncached)"""
+        with self.engine.connect() as conn:
+            return list(conn.execute(
+                select(CustomerMessage.id).where(*filter_conditions(filters)).order_by(CustomerMessage.id)
+            ).scalars())
+
+    def get_cluster_members(self, cluster_id: int, unresolved_only: bool = True) -> Tuple[MessageRecord, ...]:
+        """Get the messages in a near-duplicate cluster, oldest first"""
+        key = ("cluster", cluster_id, unresolved_only)
+        return self.read_model.get(MESSAGES, key, lambda: self._load_cluster_members(cluster_id, unresolved_only))
+
+    def get_messages(self, message_ids: Iterable[int]) -> Tuple[MessageRecord, ...]:
+        """Get specific messages by id, in batches (uncached)"""
+        message_ids = sorted(set(message_ids))
+        records = []
+        session = self.Session()
+        try:
+            for start in range(0, len(message_ids), BULK_BATCH_SIZE):
+                batch = message_ids[start:start + BULK_BATCH_SIZE]
+                rows = session.query(CustomerMessage).filter(CustomerMessage.id.in_(batch))
+                records.extend(MessageRecord.from_row(row) for row in rows)
+        finally:
+            session.close()
+        return tuple(records)
+
+    def iter_messages(self, filters: Optional[QueueFilter] = None,
+                      batch_size: int = 1000) -> Iterator[List[MessageRecord]]:
+        """Stream messages (optionally filtered) in id order, ``batch_size`` rows at a time (uncached)"""
+        conditions = filter_conditions(filters) if filters is not None else []
+        session = self.Session()
+        try:
+            query = session.query(CustomerMessage).filter(*conditions).order_by(CustomerMessage.id)
+            batch = []
+            for row in query.yield_per(batch_size):
+                batch.append(MessageRecord.from_row(row))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            session.close()
+
+    def iter_rows(self, filters: QueueFilter, columns: Iterable[str],
+                  batch_size: int = 5000) -> Iterator[List[tuple]]:
+        """Stream raw column tuples for every matching message in id order (uncached).
+
+        Uses a server-side cursor, so at most ``batch_size`` rows are held in
+        memory whatever the size of the result.
+        """
+        selected = [getattr(CustomerMessage, column) for column in columns]
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+                select(*selected).where(*filter_conditions(filters)).order_by(CustomerMessage.id)
+            )
+            for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+    def get_table_versions(self) -> Dict[str, int]:
+        """Latest change_log sequence for each read-model tag's table.
+
+        A table whose entries have all been pruned reports the log's floor,
+        which is at least its last version, so versions never move backwards.
+        """
+        floor = select(func.coalesce(func.min(ChangeLog.seq) - 1, 0)).scalar_subquery()
+        with self.engine.connect() as conn:
+            rows = conn.execute(union_all(*(
+                select(literal(tag), func.coalesce(func.max(ChangeLog.seq), floor)).where(ChangeLog.table_name == table)
+                for tag, table in TAG_TABLES.items()
+            ))).all()
+        return dict(rows)
+
+    def get_change_seq(self) -> int:
+        """Latest change_log sequence number (0 for an empty log)"""
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.coalesce(func.max(ChangeLog.seq), 0))).scalar()
+
+    def get_changes(self, table_name: str, since_seq: int) -> Optional[Tuple[int, List[int]]]:
+        """Rows of ``table_name`` changed after ``since_seq``, as ``(latest_seq, row_ids)``.
+
+        Returns None when the log has been pruned past ``since_seq``; the
+        caller must then reload from scratch.
+        """
+        with self.engine.connect() as conn:
+            oldest = conn.execute(select(func.min(ChangeLog.seq))).scalar()
+            if oldest is not None and since_seq < oldest - 1:
+                return None
+            rows = conn.execute(
+                select(ChangeLog.seq, ChangeLog.row_id)
+                .where(ChangeLog.table_name == table_name, ChangeLog.seq > since_seq)
+                .order_by(ChangeLog.seq)
+            ).all()
+        latest = rows[-1].seq if rows else since_seq
+        return latest, list(dict.fromkeys(row_id for _, row_id in rows))
+
+    def get_routable_messages(self, after_id: int = 0) -> Tuple[MessageRecord, ...]:
+        """Get unresolved messages with ids above ``after_id``, oldest first (uncached)"""
+        session = self.Session()
+        try:
+            rows = session.query(CustomerMessage).filter(
+                CustomerMessage.id > after_id,
+                CustomerMessage.status != 'resolved'
+            ).order_by(CustomerMessage.id)
+            return tuple(MessageRecord.from_row(row) for row in rows)
+        finally:
+            session.close()
+
+    def _load_message_count(self, filters: QueueFilter) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(CustomerMessage).where(*filter_conditions(filters))).scalar()
+
+    def _load_queue_page(self, filters: QueueFilter) -> Tuple[MessageRecord, ...]:
+        session = self.Session()
+        try:
+            order = queue_order(filters.sort)
+            customer_sort = filters.sort in CUSTOMER_SORT_COLUMNS
+            if not filters.group_clusters:
+                query = session.query(CustomerMessage)
+                if customer_sort:
+                    query = query.outerjoin(CustomerStats, CustomerStats.user_id == CustomerMessage.user_id)
+                query = query.filter(*filter_conditions(filters)).order_by(*order)
+                return tuple(MessageRecord.from_row(row) for row in query.limit(filters.limit))
+
+            # First member of each cluster in queue order, with the number of matching members
+            cluster_key = func.coalesce(CustomerMessage.cluster_id, CustomerMessage.id)
+            ranked = select(
+                CustomerMessage.id.label('id'),
+                func.row_number().over(partition_by=cluster_key, order_by=order).label('rank'),
+                func.count().over(partition_by=cluster_key).label('size'),
+            )
+            if customer_sort:
+                ranked = ranked.outerjoin(CustomerStats, CustomerStats.user_id == CustomerMessage.user_id)
+            ranked = ranked.where(*filter_conditions(filters)).subquery()
+            query = session.query(CustomerMessage, ranked.c.size).join(ranked, ranked.c.id == CustomerMessage.id)
+            if customer_sort:
+                query = query.outerjoin(CustomerStats, CustomerStats.user_id == CustomerMessage.user_id)
+            query = query.filter(ranked.c.rank == 1).order_by(*order)
+            return tuple(
+                replace(MessageRecord.from_row(row), cluster_size=size)
+                for row, size in query.limit(filters.limit)
+            )
+        finally:
+            session.close()
+
+    def _load_cluster_members(self, cluster_id: int, unresolved_only: bool) -> Tuple[MessageRecord, ...]:
+        session = self.Session()
+        try:
+            query = session.query(CustomerMessage).filter(CustomerMessage.cluster_id == cluster_id)
+            if unresolved_only:
+                query = query.filter(CustomerMessage.status != 'resolved')
+            return tuple(MessageRecord.from_row(row) for row in query.order_by(CustomerMessage.timestamp))
+        finally:
+            session.close()
+
+    def _load_message_stats(self, today: date) -> MessageStats:
+        session = self.Session()
+        try:
+            total = session.query(CustomerMessage).count()
+            pending = session.query(CustomerMessage).filter(CustomerMessage.status == 'pending').count()
+            high_priority = session.query(CustomerMessage).filter(CustomerMessage.priority == 'high').count()
+            today_messages = session.query(CustomerMessage).filter(
+                CustomerMessage.timestamp >= datetime.combine(today, datetime.min.time())
+            ).count()
+
+            return MessageStats(
+                total=total,
+                pending=pending,
+                high_priority=high_priority,
+                today=today_messages
+            )
+        finally:
+            session.close()
+
+    def _load_thread(self, message_id: int) -> Optional[MessageRecord]:
+        session = self.Session()
+        try:
+            row = session.get(CustomerMessage, message_id)
+            return MessageRecord.from_row(row) if row else None
+        finally:
+            session.close()
+
+    def _load_profile(self, user_id: int) -> Optional[ProfileRecord]:
+        session = self.Session()
+        try:
+            row = session.get(CustomerProfile, user_id)
+            return ProfileRecord.from_row(row) if row else None
+        finally:
+            session.close()
+
+    def _load_customer_stats(self, user_id: int) -> Optional[CustomerStatsRecord]:
+        session = self.Session()
+        try:
+            row = session.get(CustomerStats, user_id)
+            return CustomerStatsRecord.from_row(row) if row else None
+        finally:
+            session.close()
+
+    def _load_customer_signals(self, sort: str) -> Tuple[Tuple[int, object], ...]:
+        column = CUSTOMER_SORT_COLUMNS[sort]
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(CustomerStats.user_id, column).order_by(CustomerStats.user_id)).all()
+        return tuple((user_id, value) for user_id, value in rows)
+
+    def _load_deliveries(self, message_id: int) -> Tuple[OutboundRecord, ...]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(OutboundMessage).where(OutboundMessage.message_id == message_id).order_by(OutboundMessage.id)
+            ).all()
+        return tuple(OutboundRecord.from_row(row) for row in rows)
+
+    def _load_canned_responses(self) -> Tuple[TemplateRecord, ...]:
+        session = self.Session()
+        try:
+            rows = session.query(CannedResponse).order_by(CannedResponse.use_count.desc()).all()
+            return tuple(TemplateRecord.from_row(row) for row in rows)
+        finally:
+            session.close()
+
+    # ------------------------------------------------------------------
+    # Transitions
+    # ------------------------------------------------------------------
+
+    def ingest_messages(self, messages: Iterable[Tuple[int, datetime, str]]) -> List[int]:
+        """Store new ``(user_id, timestamp, body)`` messages.
+
+        Each body goes through :func:`utils.score_message` once, and the new rows
+        are clustered against existing ones in the same transaction.
+        """
+        from clustering import assign_clusters
+        import utils
+
+        rows, signatures = [], []
+        for user_id, timestamp, body in messages:
+            scores = utils.score_message(body)
+            signatures.append(scores.pop('signature'))
+            rows.append(CustomerMessage(user_id=user_id, timestamp=timestamp, message_body=body, **scores))
+        if not rows:
+            return []
+
+        session = self.Session()
+        try:
+            session.add_all(rows)
+            session.flush()
+            assign_clusters(session.connection(), [(row.id, sig) for row, sig in zip(rows, signatures)])
+            session.commit()
+            ids = [row.id for row in rows]
+        finally:
+            session.close()
+
+        self.read_model.invalidate(MESSAGES)
+        return ids
+
+    def update_message_status(self, message_id: int, status: str,
+                              agent_name: Optional[str] = None,
+                              response_text: Optional[str] = None,
+                              template_id: Optional[int] = None) -> bool:
+        """Update message status, optionally recording a response.
+
+        When the response came from a canned template, pass ``template_id`` so
+        its use count is bumped in the same transaction.
+        """
+        if status not in MESSAGE_STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+
+        session = self.Session()
+        try:
+            message = session.get(CustomerMessage, message_id)
+            if not message:
+                return False
+            message.status = status
+            if agent_name:
+                message.agent_id = agent_name
+            if response_text:
+                message.response = response_text
+                message.response_timestamp = datetime.now()
+                # Queued for delivery in the same transaction as the stored response
+                session.execute(
+                    insert(OutboundMessage)
+                    .values(
+                        message_id=message.id, user_id=message.user_id, body=response_text,
+                        idempotency_key=idempotency_key(message.id, response_text), status='queued',
+                        attempts=0, next_attempt_at=message.response_timestamp,
+                        created_at=message.response_timestamp,
+                    )
+                    .on_conflict_do_nothing(index_elements=['idempotency_key'])
+                )
+            if template_id is not None:
+                template = session.get(CannedResponse, template_id)
+                if template:
+                    template.use_count = (template.use_count or 0) + 1
+            session.commit()
+        finally:
+            session.close()
+
+        tags = [MESSAGES]
+        if template_id is not None:
+            tags.append(TEMPLATES)
+        if response_text:
+            tags.append(OUTBOX)
+        self.read_model.invalidate(*tags)
+        return True
+
+    def bulk_update_status(self, message_ids: Iterable[int], status: str,
+                           agent_name: Optional[str] = None,
+                           response_text: Optional[str] = None,
+                           template_id: Optional[int] = None) -> BulkUpdateResult:
+        """Apply one status change (and optional response) to many messages.
+
+        Runs a single transaction with one set-based UPDATE per
+        ``BULK_BATCH_SIZE`` ids, followed by a single cache invalidation.
+        A response only goes to messages that are unresolved and unanswered;
+        the others are skipped rather than answered a second time.
+        """
+        message_ids = sorted(set(message_ids))
+        with self.engine.begin() as conn:
+            updated = self._bulk_update(conn, message_ids, status, agent_name, response_text, template_id)
+        self._invalidate_after_bulk(updated, template_id, response_text)
+        return BulkUpdateResult(updated, len(message_ids) - len(updated))
+
+    def bulk_update_filtered(self, filters: QueueFilter, status: str,
+                             agent_name: Optional[str] = None,
+                             response_text: Optional[str] = None,
+                             template_id: Optional[int] = None) -> BulkUpdateResult:
+        """Like :meth:`bulk_update_status`, for every message matching ``filters``"""
+        with self.engine.begin() as conn:
+            message_ids = list(conn.execute(
+                select(CustomerMessage.id).where(*filter_conditions(filters)).order_by(CustomerMessage.id)
+            ).scalars())
+            updated = self._bulk_update(conn, message_ids, status, agent_name, response_text, template_id)
+        self._invalidate_after_bulk(updated, template_id, response_text)
+        return BulkUpdateResult(updated, len(message_ids) - len(updated))
+
+    def _bulk_update(self, conn, message_ids: List[int], status: str, agent_name: Optional[str],
+                     response_text: Optional[str], template_id: Optional[int]) -> List[int]:
+        if status not in MESSAGE_STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+
+        now = datetime.now()
+        values = {'status': status}
+        conditions = []
+        if agent_name:
+            values['agent_id'] = agent_name
+        if response_text:
+            values['response'] = response_text
+            values['response_timestamp'] = now
+            # Never overwrite a reply already given, nor queue a second one for that customer
+            conditions += [CustomerMessage.status != 'resolved',
+                           or_(CustomerMessage.response.is_(None), CustomerMessage.response == '')]
+
+        updated = []
+        for start in range(0, len(message_ids), BULK_BATCH_SIZE):
+            batch = conn.execute(
+                update(CustomerMessage)
+                .where(CustomerMessage.id.in_(message_ids[start:start + BULK_BATCH_SIZE]), *conditions)
+                .values(**values)
+                .returning(CustomerMessage.id)
+            ).scalars().all()
+            if response_text and batch:
+                self._enqueue_responses(conn, batch, response_text, now)
+            updated.extend(batch)
+
+        if template_id is not None and updated:
+            conn.execute(
+                update(CannedResponse)
+                .where(CannedResponse.id == template_id)
+                .values(use_count=CannedResponse.use_count + len(updated))
+            )
+        return sorted(updated)
+
+    def _enqueue_responses(self, conn, message_ids: List[int], response_text: str, now: datetime):
+        """Queue one outbox row per message with a single INSERT ... SELECT"""
+        digest = response_digest(response_text)
+        conn.execute(
+            insert(OutboundMessage)
+            .from_select(
+                ['message_id', 'user_id', 'body', 'idempotency_key', 'status', 'attempts',
+                 'next_attempt_at', 'created_at'],
+                select(
+                    CustomerMessage.id, CustomerMessage.user_id, literal(response_text),
+                    CustomerMessage.id.cast(String) + literal(f":{digest}"), literal('queued'), literal(0),
+                    literal(now), literal(now),
+                ).where(CustomerMessage.id.in_(message_ids))
+            )
+            .prefix_with('OR IGNORE')
+        )
+
+    def _invalidate_after_bulk(self, updated: List[int], template_id: Optional[int],
+                               response_text: Optional[str] = None):
+        if not updated:
+            return
+        tags = [MESSAGES]
+        if template_id is not None:
+            tags.append(TEMPLATES)
+        if response_text:
+            tags.append(OUTBOX)
+        self.read_model.invalidate(*tags)
+
+    def assign_messages(self, assignments: Iterable[Tuple[int, str]]) -> int:
+        """Persist ``(message_id, agent_id)`` routing decisions in one transaction"""
+        by_agent: Dict[str, List[int]] = {}
+        for message_id, agent_id in assignments:
+            by_agent.setdefault(agent_id, []).append(message_id)
+        if not by_agent:
+            return 0
+
+        updated = 0
+        with self.engine.begin() as conn:
+            for agent_id, message_ids in by_agent.items():
+                updated += conn.execute(
+                    update(CustomerMessage)
+                    .where(CustomerMessage.id.in_(message_ids))
+                    .values(agent_id=agent_id)
+                ).rowcount
+
+        self.read_model.invalidate(MESSAGES)
+        return updated
+
+    def claim_messages(self, assignments: Iterable[Tuple[int, str]]) -> List[int]:
+        """Persist ``(message_id, agent_id)`` routing decisions for messages nobody holds yet.
+
+        Returns the ids actually claimed; the rest were assigned (or removed)
+        by another process first and keep their current agent.
+        """
+        by_agent: Dict[str, List[int]] = {}
+        for message_id, agent_id in assignments:
+            by_agent.setdefault(agent_id, []).append(message_id)
+        if not by_agent:
+            return []
+
+        claimed = []
+        with self.engine.begin() as conn:
+            for agent_id, message_ids in by_agent.items():
+                for start in range(0, len(message_ids), BULK_BATCH_SIZE):
+                    claimed.extend(conn.execute(
+                        update(CustomerMessage)
+                        .where(CustomerMessage.id.in_(message_ids[start:start + BULK_BATCH_SIZE]),
+                               CustomerMessage.agent_id.is_(None))
+                        .values(agent_id=agent_id)
+                        .returning(CustomerMessage.id)
+                    ).scalars())
+
+        if claimed:
+            self.read_model.invalidate(MESSAGES)
+        return claimed
+
+    def add_canned_response(self, title: str, response_text: str, category: Optional[str]) -> TemplateRecord:
+        """Add new canned response"""
+        session = self.Session()
+        try:
+            response = CannedResponse(
+                title=title,
+                response_text=response_text,
+                category=category,
+                use_count=0
+            )
+            session.add(response)
+            session.commit()
+            record = TemplateRecord.from_row(response)
+        finally:
+            session.close()
+
+        self.read_model.invalidate(TEMPLATES)
+        return record
+
+    # ------------------------------------------------------------------
+    # Outbound delivery
+    # ------------------------------------------------------------------
+
+    def get_outbox_counts(self) -> Dict[str, int]:
+        """Get the number of outbox rows in each delivery status"""
+        return self.read_model.get(OUTBOX, ("counts",), self._load_outbox_counts)
+
+    def _load_outbox_counts(self) -> Dict[str, int]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(OutboundMessage.status, func.count()).group_by(OutboundMessage.status)
+            ).all()
+        counts = dict.fromkeys(OUTBOX_STATUSES, 0)
+        counts.update(dict(rows))
+        return counts
+
+    def has_due_outbound(self) -> bool:
+        """Whether any outbox row is due for sending; a read-only check idle workers make before claiming"""
+        with self.engine.connect() as conn:
+            return conn.execute(select(OutboundMessage.id).where(*outbound_due(datetime.now())).limit(1)).first() is not None
+
+    def claim_outbound(self, limit: int, lease: timedelta) -> Tuple[OutboundRecord, ...]:
+        """Atomically claim up to ``limit`` due outbox rows for sending.
+
+        Claimed rows move to ``sending``, their attempt counter is bumped and
+        ``next_attempt_at`` becomes the lease expiry: if the worker dies
+        mid-send, the rows fall due again and another worker retries them.
+        One UPDATE ... RETURNING, so concurrent workers never claim the same row.
+        """
+        now = datetime.now()
+        due = (
+            select(OutboundMessage.id)
+            .where(*outbound_due(now))
+            .order_by(OutboundMessage.next_attempt_at)
+            .limit(limit)
+        )
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                update(OutboundMessage)
+                .where(OutboundMessage.id.in_(due.scalar_subquery()))
+                .values(status="sending", attempts=OutboundMessage.attempts + 1, next_attempt_at=now + lease)
+                .returning(*OutboundMessage.__table__.columns)
+            ).all()
+
+        if rows:
+            self.read_model.invalidate(OUTBOX)
+        return tuple(sorted((OutboundRecord.from_row(row) for row in rows), key=lambda r: r.id))
+
+    def settle_outbound(self, delivered: Iterable[Tuple[int, str]] = (),
+                        retry: Iterable[Tuple[int, str, datetime]] = (),
+                        failed: Iterable[Tuple[int, str]] = ()) -> int:
+        """Record the outcome of a send in one transaction.
+
+        ``delivered`` holds ``(outbox_id, gateway_message_id)``, ``retry`` holds
+        ``(outbox_id, error, next_attempt_at)`` and ``failed`` holds
+        ``(outbox_id, error)`` for rows that will not be retried.
+        Returns the number of rows settled.
+        """
+        now = datetime.now()
+        table = OutboundMessage.__table__
+        batches = [
+            ([{'b_id': i, 'b_gateway_id': g} for i, g in delivered],
+             {'status': 'delivered', 'gateway_message_id': bindparam('b_gateway_id'),
+              'delivered_at': now, 'last_error': None}),
+            ([{'b_id': i, 'b_error': e, 'b_next': n} for i, e, n in retry],
+             {'status': 'queued', 'last_error': bindparam('b_error'), 'next_attempt_at': bindparam('b_next')}),
+            ([{'b_id': i, 'b_error': e} for i, e in failed],
+             {'status': 'failed', 'last_error': bindparam('b_error')}),
+        ]
+        settled = 0
+        with self.engine.begin() as conn:
+            for params, values in batches:
+                if params:
+                    conn.execute(update(table).where(table.c.id == bindparam('b_id')).values(**values), params)
+                    settled += len(params)
+
+        if settled:
+            self.read_model.invalidate(OUTBOX)
+        return settled
@@ -0,0 +1,313 @@
+"""Skill-based, load-balanced assignment of messages to agents.
+
+:class:`AssignmentEngine` keeps one priority heap per category. A message's
+heap key is ``arrival * aging_rate - urgency``: the effective priority
+``urgency + aging_rate * (now - arrival)`` differs from it only by a term that
+is the same for every message, so aging never forces a re-heapify and each
+push/pop stays O(log n).
+
+:class:`Router` connects the engine to :class:`repository.MessageRepository`
+so assignments are written to the indexed ``customer_messages`` table, and
+follows the ``change_log`` so every process sees the others' assignments.
+"""
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Urgency points gained per second of waiting: one point every 10 minutes, so a
+# low-urgency message overtakes a fresh high-urgency one within a few hours.
+AGING_RATE = 1 / 600
+
+
+@dataclass(frozen=True)
+class Agent:
+    """An agent, the categories they handle and how many open messages they can hold"""
+    agent_id: str
+    skills: FrozenSet[str] = field(default_factory=frozenset)  # empty means any category
+    capacity: int = 5
+
+    def handles(self, category: str) -> bool:
+        return not self.skills or category in self.skills
+
+
+DEFAULT_AGENTS = (
+    Agent("Agent_01", frozenset({"loan_application", "clearance"})),
+    Agent("Agent_02", frozenset({"loan_application", "payment"})),
+    Agent("Agent_03", frozenset({"payment", "account", "account_update", "technical"})),
+    Agent("Agent_04", frozenset({"urgent", "urgent_inquiry", "fraud", "general", "other"})),
+    Agent("Agent_05"),
+)
+
+
+class AssignmentEngine:
+    """In-memory routing state: per-category heaps plus per-agent load.
+
+    Not tied to the database; callers persist the assignments it returns.
+    Thread-safe, since one engine is shared by every session in the process.
+    """
+
+    def __init__(self, agents: Iterable[Agent] = DEFAULT_AGENTS,
+                 aging_rate: float = AGING_RATE,
+                 clock: Callable[[], float] = time.time):
+        self.agents: Dict[str, Agent] = {agent.agent_id: agent for agent in agents}
+        self.aging_rate = aging_rate
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._queues: Dict[str, List[Tuple[float, int, int]]] = {}
+        self._queued: Dict[int, str] = {}  # message id -> category, for lazy deletion
+        self._assigned: Dict[int, str] = {}  # message id -> agent id
+        self._load: Dict[str, int] = {agent_id: 0 for agent_id in self.agents}
+        self._eligible: Dict[str, Tuple[Agent, ...]] = {}
+        self._seq = itertools.count()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def load(self, agent_id: str) -> int:
+        return self._load.get(agent_id, 0)
+
+    def assigned_to(self, message_id: int) -> Optional[str]:
+        return self._assigned.get(message_id)
+
+    def queue_depth(self) -> int:
+        return len(self._queued)
+
+    def depth_by_category(self) -> Dict[str, int]:
+        with self._lock:
+            depths: Dict[str, int] = {}
+            for category in self._queued.values():
+                depths[category] = depths.get(category, 0) + 1
+            return depths
+
+    # ------------------------------------------------------------------
+    # Transitions
+    # ------------------------------------------------------------------
+
+    def submit(self, message_id: int, category: Optional[str], urgency: int,
+               arrival: Optional[float] = None) -> Optional[str]:
+        """Route a new message; returns the agent it was assigned to, or None if queued"""
+        category = category or "other"
+        arrival = self.clock() if arrival is None else arrival
+        with self._lock:
+            if message_id in self._assigned or message_id in self._queued:
+                return self._assigned.get(message_id)
+
+            agent = self._least_loaded(category)
+            if agent is not None:
+                self._assign(message_id, agent.agent_id)
+                return agent.agent_id
+
+            key = arrival * self.aging_rate - urgency
+            heapq.heappush(self._queues.setdefault(category, []), (key, next(self._seq), message_id))
+            self._queued[message_id] = category
+            return None
+
+    def restore(self, message_id: int, agent_id: str):
+        """Record an assignment that already exists (e.g. loaded from the database)"""
+        with self._lock:
+            if message_id in self._assigned or agent_id not in self.agents:
+                return
+            self._queued.pop(message_id, None)
+            self._assign(message_id, agent_id)
+
+    def reassign(self, message_id: int, agent_id: str):
+        """Move a message to a specific agent, whether queued or held by someone else"""
+        with self._lock:
+            if agent_id not in self.agents:
+                return
+            self._queued.pop(message_id, None)
+            previous = self._assigned.pop(message_id, None)
+            if previous is not None:
+                self._load[previous] -= 1
+            self._assign(message_id, agent_id)
+
+    def next_for(self, agent_id: str) -> Optional[int]:
+        """Pop the highest effective-priority message this agent can handle.
+
+        Ignores the agent's capacity, so it doubles as an explicit "pull next".
+        """
+        agent = self.agents.get(agent_id)
+        if agent is None:
+            return None
+        with self._lock:
+            best = None
+            for category, heap in self._queues.items():
+                if not agent.handles(category):
+                    continue
+                self._drop_stale(heap)
+                if heap and (best is None or heap[0] < best[0]):
+                    best = (heap[0], category)
+            if best is None:
+                return None
+            _, _, message_id = heapq.heappop(self._queues[best[1]])
+            del self._queued[message_id]
+            self._assign(message_id, agent_id)
+            return message_id
+
+    def complete(self, message_id: int) -> Optional[Tuple[str, Optional[int]]]:
+        """Release a finished message.
+
+        Returns ``(agent_id, next_message_id)``: the freed capacity is used at
+        once to hand that agent their next message, if one is waiting.
+        """
+        with self._lock:
+            agent_id = self._assigned.pop(message_id, None)
+            if agent_id is None:
+                self.cancel(message_id)
+                return None
+            self._load[agent_id] -= 1
+            next_id = None
+            if self._load[agent_id] < self.agents[agent_id].capacity:
+                next_id = self.next_for(agent_id)
+            return agent_id, next_id
+
+    def cancel(self, message_id: int):
+        """Forget a queued message (resolved elsewhere); its heap entry is dropped lazily"""
+        with self._lock:
+            self._queued.pop(message_id, None)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _assign(self, message_id: int, agent_id: str):
+        self._assigned[message_id] = agent_id
+        self._load[agent_id] += 1
+
+    def _least_loaded(self, category: str) -> Optional[Agent]:
+        eligible = self._eligible.get(category)
+        if eligible is None:
+            eligible = tuple(agent for agent in self.agents.values() if agent.handles(category))
+            self._eligible[category] = eligible
+
+        best, best_key = None, None
+        for agent in eligible:
+            load = self._load[agent.agent_id]
+            if load >= agent.capacity:
+                continue
+            # Lowest utilisation first; on ties prefer specialists over generalists.
+            key = (load / agent.capacity, not agent.skills)
+            if best_key is None or key < best_key:
+                best, best_key = agent, key
+        return best
+
+    def _drop_stale(self, heap: List[Tuple[float, int, int]]):
+        while heap and heap[0][2] not in self._queued:
+            heapq.heappop(heap)
+
+
+class Router:
+    """Keeps an :class:`AssignmentEngine` in step with the database.
+
+    Every app process has its own router, so the database is the source of
+    truth. :meth:`sync` replays the ``change_log`` stream the way
+    :meth:`queue_engine.QueueSnapshot.refresh` does. Resolutions, deletions
+    and assignments made by other processes then release or move slots here
+    too. New routes are claimed with a conditional update that only takes
+    unassigned messages. A process that loses the race adopts the winner's
+    assignment instead of overwriting it.
+    """
+
+    def __init__(self, repository, engine: Optional[AssignmentEngine] = None):
+        self.repository = repository
+        self.engine = engine if engine is not None else AssignmentEngine()
+        self.seq: Optional[int] = None  # last change_log sequence applied; None before the first sync
+        self._lock = threading.RLock()
+
+    def sync(self) -> List[Tuple[int, str]]:
+        """Apply message changes since the last sync and route new messages.
+
+        Returns the new ``(message_id, agent_id)`` assignments this process persisted.
+        """
+        with self._lock:
+            changes = None if self.seq is None else self.repository.get_changes('customer_messages', self.seq)
+            if changes is None:
+                # First sync, or the log was pruned past us: rebuild from the open messages
+                if self.seq is not None:
+                    self.engine = AssignmentEngine(self.engine.agents.values(), self.engine.aging_rate,
+                                                   self.engine.clock)
+                # Read the log position first so nothing written during the load is missed
+                self.seq = self.repository.get_change_seq()
+                message_ids, records = [], self.repository.get_routable_messages()
+            else:
+                self.seq, message_ids = changes
+                records = self.repository.get_messages(message_ids) if message_ids else ()
+            return self._persist(self._mirror(records, message_ids))
+
+    def _mirror(self, records, message_ids: Iterable[int] = ()) -> List[Tuple[int, str]]:
+        """Bring the engine in line with the database rows; returns routes that still need persisting"""
+        pending: Dict[int, str] = {}
+        found = {record.id for record in records}
+        for message_id in message_ids:
+            if message_id not in found:  # deleted
+                self._complete(message_id, pending)
+        for record in records:
+            held_by = self.engine.assigned_to(record.id)
+            if record.status == "resolved":
+                self._complete(record.id, pending)
+            elif record.agent_id:
+                if held_by != record.agent_id:
+                    self.engine.reassign(record.id, record.agent_id)
+                pending.pop(record.id, None)
+            elif held_by is not None:
+                pending[record.id] = held_by
+            else:
+                agent_id = self.engine.submit(record.id, record.category, record.urgency_score,
+                                              arrival=record.timestamp.timestamp())
+                if agent_id:
+                    pending[record.id] = agent_id
+        return list(pending.items())
+
+    def _complete(self, message_id: int, pending: Dict[int, str]):
+        pending.pop(message_id, None)
+        released = self.engine.complete(message_id)
+        if released is not None and released[1] is not None:
+            pending[released[1]] = released[0]
+
+    def _persist(self, assignments: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """Claim routes in the database; routes lost to another process are replaced by what it wrote"""
+        persisted = []
+        while assignments:
+            claimed = set(self.repository.claim_messages(assignments))
+            persisted.extend(assignment for assignment in assignments if assignment[0] in claimed)
+            lost = [message_id for message_id, _ in assignments if message_id not in claimed]
+            assignments = self._mirror(self.repository.get_messages(lost), lost) if lost else []
+        return persisted
+
+    def pull_next(self, agent_id: str) -> Optional[int]:
+        """Hand the agent the most pressing waiting message they can handle"""
+        with self._lock:
+            while True:
+                message_id = self.engine.next_for(agent_id)
+                if message_id is None or (message_id, agent_id) in self._persist([(message_id, agent_id)]):
+                    return message_id
+
+    def release(self, message_id: int) -> Optional[int]:
+        """Free the agent's slot after resolving a message; returns the message routed in its place"""
+        assignments = self.release_many([message_id])
+        return assignments[0][0] if assignments else None
+
+    def release_many(self, message_ids: Iterable[int]) -> List[Tuple[int, str]]:
+        """Free the slots of many resolved messages; refills are claimed in one transaction"""
+        with self._lock:
+            pending: Dict[int, str] = {}
+            for message_id in message_ids:
+                self._complete(message_id, pending)
+            return self._persist(list(pending.items()))
+
+    def assign_many(self, message_ids: Iterable[int], agent_id: str) -> int:
+        """Hand a set of messages to one agent, bypassing skill and capacity checks.
+
+        Resolved messages are skipped: they hold no slot, and nothing would
+        ever release one taken for them.
+        """
+        with self._lock:
+            message_ids = [record.id for record in self.repository.get_messages(message_ids)
+                           if record.status != "resolved"]
+            for message_id in message_ids:
+                self.engine.reassign(message_id, agent_id)
+            return self.repository.assign_messages([(message_id, agent_id) for message_id in message_ids])
@@ -0,0 +1,209 @@
+"""Host-wide cache tier shared by every Streamlit process.
+
+:class:`SharedCache` is a small SQLite file (WAL mode, one connection per
+thread) holding msgpack-encoded read results. It sits behind each process's
+:class:`repository.ReadModel`: a local miss looks here before running the
+query, and a query result is published here for the other processes.
+
+Keys embed the version of the table family they were read from. That
+version is the table's latest ``change_log`` sequence, so any write from any
+process (or any other client of the database) moves readers to fresh keys,
+and stale entries are simply never read again. They age out under the
+size-bounded, least-recently-used eviction.
+
+Sequences restart when a database is recreated, so keys are also scoped by
+the random id stamped on the database at bootstrap, by the schema version and
+by a fingerprint of the codec's record layouts: a reseeded database or a
+deploy that changes a record never reads another timeline's or layout's
+entries. After restoring a backup, give the database a new id with
+``python maintenance.py --new-database-id``.
+"""
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+import time
+from dataclasses import fields
+from datetime import date, datetime, timedelta
+from typing import Hashable, Tuple
+
+import msgpack
+
+from database import SCHEMA_VERSION
+from repository import CustomerStatsRecord, MessageRecord, MessageStats, OutboundRecord, ProfileRecord, TemplateRecord
+
+SHARED_CACHE_PATH = 'cs_cache.db'
+
+# Total payload kept before the least recently used entries are evicted
+MAX_BYTES = 64 * 1024 * 1024
+
+# Eviction trims down to this fraction of MAX_BYTES so it does not run on every write
+EVICT_TO = 0.9
+
+# Hits refresh an entry's recency at most this often (seconds), so most hits stay read-only
+TOUCH_INTERVAL = 5.0
+
+# Record types the codec can carry, by wire code; append only
+RECORD_TYPES = (MessageRecord, TemplateRecord, ProfileRecord, MessageStats, OutboundRecord, CustomerStatsRecord)
+
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_RECORD = 3
+_EPOCH = datetime(1970, 1, 1)
+_RECORD_CODES = {cls: code for code, cls in enumerate(RECORD_TYPES)}
+_RECORD_FIELDS = {cls: tuple(field.name for field in fields(cls)) for cls in RECORD_TYPES}
+
+# Bump when the encoding changes; record layouts are fingerprinted below without a bump
+CODEC_VERSION = 1
+CODEC_ID = hashlib.blake2b(
+    repr((CODEC_VERSION, [(cls.__name__, names) for cls, names in _RECORD_FIELDS.items()])).encode('utf-8'),
+    digest_size=4
+).hexdigest()
+
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, struct.pack('>q', (obj - _EPOCH) // timedelta(microseconds=1)))
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, struct.pack('>i', obj.toordinal()))
+    code = _RECORD_CODES.get(type(obj))
+    if code is not None:
+        values = [code] + [getattr(obj, name) for name in _RECORD_FIELDS[type(obj)]]
+        return msgpack.ExtType(_EXT_RECORD, msgpack.packb(values, default=_default))
+    raise TypeError(f"Cannot cache {type(obj).__name__}")
+
+
+def _ext_hook(code, data):
+    if code == _EXT_DATETIME:
+        return _EPOCH + timedelta(microseconds=struct.unpack('>q', data)[0])
+    if code == _EXT_DATE:
+        return date.fromordinal(struct.unpack('>i', data)[0])
+    if code == _EXT_RECORD:
+        values = msgpack.unpackb(data, ext_hook=_ext_hook, use_list=False, strict_map_key=False)
+        return RECORD_TYPES[values[0]](*values[1:])
+    return msgpack.ExtType(code, data)
+
+
+def encode(value) -> bytes:
+    """msgpack with datetimes, dates and repository records as extension types"""
+    return msgpack.packb(value, default=_default)
+
+
+def decode(payload: bytes):
+    """Inverse of :func:`encode`; sequences come back as tuples"""
+    return msgpack.unpackb(payload, ext_hook=_ext_hook, use_list=False, strict_map_key=False)
+
+
+def cache_key(database_id: str, tag: str, version: int, key: Hashable) -> str:
+    """Shared-cache key for a read-model entry at a table-family version of one database"""
+    digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+    return f"{database_id}:{SCHEMA_VERSION}:{CODEC_ID}:{tag}:{version}:{digest}"
+
+
+class SharedCache:
+    """Size-bounded LRU in a SQLite file, safe across threads and processes"""
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, max_bytes: int = MAX_BYTES):
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes_written = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (accessed)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # a lost cache write only costs a query
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Tuple[bool, object]:
+        """``(True, value)`` on a hit, ``(False, None)`` on a miss"""
+        conn = self._connection()
+        row = conn.execute("SELECT value, accessed FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        now = time.time()
+        if now - row[1] > TOUCH_INTERVAL:
+            conn.execute("UPDATE cache_entries SET accessed = ? WHERE key = ?", (now, key))
+        return True, decode(row[0])
+
+    def set(self, key: str, value):
+        """Store a value, evicting the least recently used entries when over budget"""
+        payload = encode(value)
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+            (key, payload, len(payload), time.time())
+        )
+        with self._lock:
+            self._bytes_written += len(payload)
+            # Check the total only once a tenth of the budget has been written by this process
+            check = self._bytes_written >= self.max_bytes // 10
+            if check:
+                self._bytes_written = 0
+        if check:
+            self.evict()
+
+    def evict(self) -> int:
+        """Trim to EVICT_TO of the budget, oldest access first; returns entries removed"""
+        conn = self._connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        excess = total - int(self.max_bytes * EVICT_TO)
+        cursor = conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed")
+        victims = []
+        for key, size in cursor:
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        cursor.close()
+        conn.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+        removed = len(victims)
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def lookup(self, database_id: str, tag: str, version: int, key: Hashable) -> Tuple[bool, object]:
+        """ReadModel hook: :meth:`get` for an entry at a tag version"""
+        return self.get(cache_key(database_id, tag, version, key))
+
+    def publish(self, database_id: str, tag: str, version: int, key: Hashable, value):
+        """ReadModel hook: :meth:`set` for an entry at a tag version"""
+        self.set(cache_key(database_id, tag, version, key), value)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entries")
+
+    def stats(self) -> dict:
+        """Entry count, payload bytes and this process's hit ratio"""
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,21 @@
+"""Shared fixtures: every test gets its own empty, fully migrated database."""
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # no seed CSV here, so the database starts empty
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    event.listen(engine, 'connect', database.configure_connection)
+    database.bootstrap_schema(engine)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from repository import MessageRepository
+
+
+@pytest.fixture
+def repository(engine):
+    return MessageRepository(engine)
+
+
+@pytest.fixture
+def message_ids(repository):
+    start = datetime(2024, 1, 1)
+    return repository.ingest_messages([(700 + i, start + timedelta(minutes=i), f"Loan question {i}")
+                                       for i in range(3)])
+
+
+def test_bulk_update_returns_rows_actually_updated(repository, message_ids):
+    template = repository.add_canned_response("Thanks", "Thanks for waiting", None)
+    missing = max(message_ids) + 100
+
+    result = repository.bulk_update_status(message_ids + [missing], "in_progress", template_id=template.id)
+
+    assert result.updated == sorted(message_ids)
+    assert result.skipped == 1
+    [stored] = [t for t in repository.get_canned_responses() if t.id == template.id]
+    assert stored.use_count == len(message_ids)
+
+
+def test_bulk_response_skips_answered_messages(repository, message_ids):
+    answered, resolved, fresh = message_ids
+    repository.update_message_status(answered, "in_progress", "Agent_01", "First reply")
+    repository.update_message_status(resolved, "resolved", "Agent_01")
+
+    result = repository.bulk_update_status(message_ids, "resolved", "Agent_02", "Bulk reply")
+
+    assert result.updated == [fresh]
+    assert result.skipped == 2
+    by_id = {message.id: message for message in repository.get_messages(message_ids)}
+    assert by_id[answered].response == "First reply"
+    assert by_id[resolved].response is None
+    assert [d.body for d in repository.get_deliveries(answered)] == ["First reply"]
+    assert repository.get_deliveries(resolved) == ()
+    assert [d.body for d in repository.get_deliveries(fresh)] == ["Bulk reply"]
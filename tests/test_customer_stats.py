@@ -0,0 +1,45 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from database import rebuild_customer_stats
+from repository import MessageRepository
+
+
+def stats_rows(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT * FROM customer_stats ORDER BY user_id")).mappings().all()
+    return [dict(row, category_counts=json.loads(row["category_counts"])) for row in rows]
+
+
+def test_triggers_match_rebuild(engine):
+    repository = MessageRepository(engine)
+    start = datetime(2024, 1, 1)
+    bodies = [
+        (1, "URGENT my loan was rejected, help immediately"),
+        (1, "When is my payment due?"),
+        (1, "Can I update my account details"),
+        (2, "Please send the batch number for CRB clearance"),
+        (2, "Thanks"),
+        (3, "My loan has not been disbursed"),
+        (4, "Only message from this customer"),
+    ]
+    ids = repository.ingest_messages([(user_id, start + timedelta(hours=i), body)
+                                      for i, (user_id, body) in enumerate(bodies)])
+    assert len(stats_rows(engine)) == 4
+
+    repository.update_message_status(ids[1], "resolved", "Agent_01", "Paid on Friday")
+    repository.update_message_status(ids[2], "in_progress", "Agent_02")
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE customer_messages SET category = NULL WHERE id = :id"), {"id": ids[3]})
+        # Moving customer 1's most urgent (and earliest) message forces a recompute of its extremes
+        conn.execute(text("UPDATE customer_messages SET user_id = 2 WHERE id = :id"), {"id": ids[0]})
+        conn.execute(text("UPDATE customer_messages SET urgency_score = 0 WHERE id = :id"), {"id": ids[5]})
+        conn.execute(text("DELETE FROM customer_messages WHERE id IN (:a, :b)"), {"a": ids[4], "b": ids[6]})
+
+    maintained = stats_rows(engine)
+    with engine.begin() as conn:
+        rebuild_customer_stats(conn)
+    assert maintained == stats_rows(engine)
+    assert [row["user_id"] for row in maintained] == [1, 2, 3]
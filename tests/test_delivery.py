@@ -0,0 +1,33 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from delivery import DeliveryDispatcher, MockGateway, load_gateway
+from repository import MessageRepository
+
+
+def test_load_gateway():
+    assert load_gateway("") is None
+    assert isinstance(load_gateway("mock"), MockGateway)
+    assert isinstance(load_gateway("delivery:MockGateway"), MockGateway)
+    with pytest.raises(ValueError):
+        load_gateway("delivery")
+
+
+def test_idle_dispatch_does_not_claim(engine, monkeypatch):
+    repository = MessageRepository(engine)
+    dispatcher = DeliveryDispatcher(repository, MockGateway(latency=0))
+    monkeypatch.setattr(repository, "claim_outbound", lambda *args: pytest.fail("claimed with nothing due"))
+    assert asyncio.run(dispatcher.dispatch_once()) == 0
+
+
+def test_dispatch_delivers_due_rows(engine):
+    repository = MessageRepository(engine)
+    [message_id] = repository.ingest_messages([(700, datetime(2024, 1, 1), "When is my loan paid?")])
+    repository.update_message_status(message_id, "resolved", "Agent_01", "Today")
+    assert repository.has_due_outbound()
+    dispatcher = DeliveryDispatcher(repository, MockGateway(latency=0))
+    assert asyncio.run(dispatcher.dispatch_once()) == 1
+    assert not repository.has_due_outbound()
+    assert [delivery.status for delivery in repository.get_deliveries(message_id)] == ["delivered"]
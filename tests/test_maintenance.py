@@ -0,0 +1,53 @@
+from maintenance import DEFAULT_TASKS, MaintenanceScheduler
+
+
+def test_last_runs_reports_every_task(engine):
+    clock = [30 * 86400.0]
+    scheduler = MaintenanceScheduler(engine, clock=lambda: clock[0])
+    assert scheduler.last_runs() == {}
+
+    scheduler.run_pending(force=True)
+    runs = scheduler.last_runs()
+    assert sorted(runs) == sorted(task.name for task in DEFAULT_TASKS)
+    for last_run, duration, detail in runs.values():
+        assert last_run == clock[0]
+        assert duration >= 0
+        assert isinstance(detail, str)
+
+
+def test_health_is_reused_within_ttl(engine, monkeypatch):
+    import maintenance
+
+    clock = [0.0]
+    scheduler = MaintenanceScheduler(engine, clock=lambda: clock[0])
+    reads = []
+    stats = maintenance.database_stats
+    monkeypatch.setattr(maintenance, "database_stats", lambda engine: reads.append(1) or stats(engine))
+
+    scheduler.health()
+    clock[0] = maintenance.HEALTH_TTL / 2
+    scheduler.health()
+    assert len(reads) == 1
+    clock[0] = maintenance.HEALTH_TTL
+    scheduler.health()
+    assert len(reads) == 2
+
+
+def test_low_load_counts_every_process(engine):
+    clock = [1000.0]
+    busy = MaintenanceScheduler(engine, clock=lambda: clock[0])
+    idle = MaintenanceScheduler(engine, clock=lambda: clock[0])
+    for _ in range(busy.low_load_reruns + 1):
+        busy.record_activity()
+
+    assert idle.is_low_load()  # the busy process has not reported yet
+    assert not busy.is_low_load()
+    assert not idle.is_low_load()
+
+    clock[0] += busy.low_load_window + 1
+    assert idle.is_low_load()
+
+
+def test_app_schedule_never_runs_full_vacuum(engine):
+    scheduler = MaintenanceScheduler(engine, clock=lambda: 30 * 86400.0)
+    assert "enable_incremental_vacuum" not in {name for name, _, _ in scheduler.run_pending(force=True)}
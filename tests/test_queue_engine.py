@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from queue_engine import QueueSnapshot
+from repository import UNRESOLVED, MessageRepository, QueueFilter
+
+
+@pytest.fixture
+def repository(engine):
+    return MessageRepository(engine)
+
+
+def ingest(repository, count):
+    start = datetime(2024, 1, 1)
+    return repository.ingest_messages([(700 + i, start + timedelta(minutes=i), f"Loan question {i}")
+                                       for i in range(count)])
+
+
+def test_snapshot_holds_only_open_messages(repository):
+    resolved, *open_ids = ingest(repository, 4)
+    repository.update_message_status(resolved, "resolved", "Agent_01")
+
+    snapshot = QueueSnapshot(repository)
+    assert len(snapshot) == 3
+
+    repository.bulk_update_status(open_ids[:2], "resolved", "Agent_01")
+    [new_id] = ingest(repository, 1)
+    snapshot.refresh()
+    assert sorted(message.id for message in snapshot.query(QueueFilter(status=UNRESOLVED))) == [open_ids[2], new_id]
+    assert len(snapshot) == 2
+
+
+def test_snapshot_matches_sql_for_covered_filters(repository):
+    ids = ingest(repository, 6)
+    repository.update_message_status(ids[0], "resolved", "Agent_01")
+    repository.update_message_status(ids[1], "in_progress", "Agent_02")
+    snapshot = QueueSnapshot(repository)
+
+    for status in (UNRESOLVED, "pending", "in_progress"):
+        filters = QueueFilter(status=status)
+        assert snapshot.covers(filters)
+        assert snapshot.query(filters) == repository.get_queue_page(filters)
+    for status in ("all", "resolved"):
+        assert not snapshot.covers(QueueFilter(status=status))
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from queue_engine import QueueSnapshot
+from repository import UNRESOLVED, MessageRepository, QueueFilter
+
+BODIES = [
+    "I was refunded 100% of the fee",
+    "My code is a_c please help",
+    "My code is abc please help",
+    "Loan 50 percent disbursed",
+    "my_loan was rejected",
+    "Plain message",
+]
+
+
+@pytest.fixture
+def repository(engine):
+    repository = MessageRepository(engine)
+    start = datetime(2024, 1, 1)
+    repository.ingest_messages([(700 + i, start + timedelta(minutes=i), body) for i, body in enumerate(BODIES)])
+    return repository
+
+
+@pytest.mark.parametrize("query", ["%", "_", "a_c", "100%", "_loan", "70"])
+def test_sql_search_matches_snapshot(repository, query):
+    filters = QueueFilter(search_query=query, status=UNRESOLVED, limit=50)
+    snapshot = QueueSnapshot(repository)
+    expected = [message.id for message in snapshot.query(filters)]
+    assert [message.id for message in repository.get_queue_page(filters)] == expected
+    assert sorted(repository.get_message_ids(filters)) == sorted(expected)
+
+
+def test_wildcards_match_literally(repository):
+    bodies = [message.message_body for message in repository.get_queue_page(QueueFilter(search_query="a_c", limit=50))]
+    assert bodies == ["My code is a_c please help"]
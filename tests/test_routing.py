@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from repository import MessageRepository
+from routing import Agent, AssignmentEngine, Router
+
+LOANS = frozenset({"loan_application"})
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def ingest(repository, count):
+    start = datetime(2024, 1, 1)
+    return repository.ingest_messages([(700 + i, start + timedelta(minutes=i), f"Loan question {i}")
+                                       for i in range(count)])
+
+
+def db_agents(repository, message_ids):
+    return {record.id: record.agent_id for record in repository.get_messages(message_ids)}
+
+
+def test_submit_routes_to_least_loaded_skilled_agent(clock):
+    engine = AssignmentEngine([Agent("Loans", LOANS, capacity=2),
+                               Agent("Payments", frozenset({"payment"}), capacity=2),
+                               Agent("Anyone", capacity=4)], clock=clock)
+
+    # Ties go to the specialist, then the lowest utilisation wins
+    assert [engine.submit(i, "loan_application", 3) for i in range(1, 5)] == ["Loans", "Anyone", "Anyone", "Loans"]
+    assert engine.submit(5, "payment", 2) == "Payments"
+    assert [engine.submit(i, "loan_application", 3) for i in range(6, 9)] == ["Anyone", "Anyone", None]
+    assert engine.load("Payments") == 1
+    assert engine.queue_depth() == 1
+
+
+def test_waiting_messages_age_past_fresher_urgent_ones(clock):
+    engine = AssignmentEngine([Agent("Loans", LOANS, capacity=1)], aging_rate=1 / 600, clock=clock)
+    engine.submit(1, "loan_application", 3)
+
+    engine.submit(2, "loan_application", 1)
+    clock.now = 60
+    engine.submit(3, "loan_application", 5)
+    assert engine.complete(1) == ("Loans", 3)  # a minute of waiting is worth 0.1 points
+
+    clock.now = 60 + 3600
+    engine.submit(4, "loan_application", 5)
+    assert engine.complete(3) == ("Loans", 2)  # an hour longer is worth 6
+
+
+def test_complete_refills_the_freed_slot(clock):
+    engine = AssignmentEngine([Agent("Loans", LOANS, capacity=1), Agent("Payments", frozenset({"payment"}))],
+                              clock=clock)
+    engine.submit(1, "loan_application", 3)
+    engine.submit(2, "payment", 9)
+    engine.submit(3, "loan_application", 3)
+    engine.submit(4, "loan_application", 1)
+
+    assert engine.complete(1) == ("Loans", 3)
+    assert engine.assigned_to(3) == "Loans"
+    assert engine.load("Loans") == 1
+
+    engine.cancel(4)
+    assert engine.complete(3) == ("Loans", None)
+    assert engine.load("Loans") == 0
+    assert engine.queue_depth() == 0
+
+
+def test_router_adopts_assignment_of_process_that_claimed_first(engine, clock, monkeypatch):
+    repository = MessageRepository(engine)
+    other = MessageRepository(engine)
+    first, second = ingest(repository, 2)
+    router = Router(repository, AssignmentEngine([Agent("Agent_01", LOANS), Agent("Agent_02", LOANS)], clock=clock))
+
+    claim = repository.claim_messages
+
+    def claimed_elsewhere_first(assignments):
+        monkeypatch.setattr(repository, 'claim_messages', claim)
+        other.claim_messages([(first, "Agent_02")])
+        return claim(assignments)
+
+    monkeypatch.setattr(repository, 'claim_messages', claimed_elsewhere_first)
+
+    assert router.sync() == [(second, "Agent_02")]
+    assert router.engine.assigned_to(first) == "Agent_02"
+    assert router.engine.load("Agent_01") == 0
+    assert router.engine.load("Agent_02") == 2
+    assert db_agents(repository, [first, second]) == {first: "Agent_02", second: "Agent_02"}
+
+
+def test_two_routers_contending_for_the_same_messages(engine, clock, monkeypatch):
+    repository_a, repository_b = MessageRepository(engine), MessageRepository(engine)
+    message_ids = ingest(repository_a, 8)
+    agents = [Agent("Agent_01", LOANS, capacity=3), Agent("Agent_02", LOANS, capacity=3)]
+    router_a = Router(repository_a, AssignmentEngine(agents, clock=clock))
+    # Listed the other way round, so the two processes break ties differently
+    router_b = Router(repository_b, AssignmentEngine(reversed(agents), clock=clock))
+
+    claim = repository_a.claim_messages
+
+    def other_process_first(assignments):
+        router_b.sync()
+        return claim(assignments)
+
+    # Both processes route the same batch; B commits between A's routing and A's claim
+    monkeypatch.setattr(repository_a, 'claim_messages', other_process_first)
+    assert router_a.sync() == []
+    monkeypatch.setattr(repository_a, 'claim_messages', claim)
+
+    stored = db_agents(repository_a, message_ids)
+    assert sum(agent_id is not None for agent_id in stored.values()) == 6
+    for router in (router_a, router_b):
+        assert {i: router.engine.assigned_to(i) for i in message_ids} == stored
+        assert router.engine.load("Agent_01") == router.engine.load("Agent_02") == 3
+        assert router.engine.queue_depth() == 2
+
+    # B resolves one and refills the slot; A's own refill of that slot then loses and adopts B's
+    done = message_ids[0]
+    repository_b.update_message_status(done, "resolved", stored[done])
+    [(refill, agent_id)] = router_b.release_many([done])
+    assert agent_id == stored[done]
+
+    assert router_a.sync() == []
+    stored = db_agents(repository_a, message_ids)
+    assert stored[refill] == agent_id
+    for router in (router_a, router_b):
+        assert {i: router.engine.assigned_to(i) for i in message_ids[1:]} == \
+            {i: stored[i] for i in message_ids[1:]}
+        assert router.engine.queue_depth() == 1
@@ -0,0 +1,38 @@
+import sqlite3
+
+from database import get_database_id, stamp_database_id
+from repository import MESSAGES, MessageRepository, ReadModel
+from shared_cache import SharedCache, cache_key
+
+
+def test_keys_are_scoped_by_database(engine, tmp_path):
+    shared = SharedCache(str(tmp_path / "cache.db"))
+    database_id = get_database_id(engine)
+    assert database_id
+    shared.publish(database_id, MESSAGES, 7, ("queue",), "old timeline")
+
+    with engine.begin() as conn:
+        stamp_database_id(conn)
+    assert get_database_id(engine) != database_id
+    assert shared.lookup(get_database_id(engine), MESSAGES, 7, ("queue",)) == (False, None)
+    assert cache_key("a", MESSAGES, 7, 1) != cache_key("b", MESSAGES, 7, 1)
+
+
+def test_repository_scopes_its_shared_cache(engine, tmp_path):
+    repository = MessageRepository(engine, shared_cache=SharedCache(str(tmp_path / "cache.db")))
+    assert repository.read_model.database_id == get_database_id(engine)
+
+
+class BrokenCache:
+    def lookup(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+    def publish(self, *args):
+        raise sqlite3.OperationalError("attempt to write a readonly database")
+
+
+def test_shared_tier_failures_are_misses():
+    read_model = ReadModel(versions=lambda: {MESSAGES: 1}, shared=BrokenCache(), database_id="test")
+    assert read_model.get(MESSAGES, "key", lambda: 42) == 42
+    assert read_model.get(MESSAGES, "key", lambda: 43) == 42
+    assert read_model.stats()["misses"] == 1
@@ -1,7 +1,12 @@
-import pandas as pd
+from __future__ import annotations
+
 from datetime import datetime, timedelta
 import re
-from typing import List, Dict, Tuple, Optional
+import zlib
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 def calculate_urgency_score(message: str) -> Tuple[int, str]:
     """Calculate urgency score and priority for a message"""
@@ -55,6 +60,66 @@ def categorize_message(message: str) -> str:
     
     return 'other'
 
+# Near-duplicate detection: MinHash over character shingles, banded for LSH.
+# 20 bands of 3 rows make messages with Jaccard similarity 0.5 candidates
+# ~93% of the time, while pairs at 0.2 collide only ~15% of the time.
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 60
+LSH_BANDS = 20
+_MERSENNE_PRIME = 4294967311  # smallest prime above 2**32
+_minhash_params = None
+
+def message_shingles(message: str) -> List[str]:
+    """Overlapping character shingles of the normalized message"""
+    text = re.sub(r'[^a-z0-9]+', ' ', message.lower()).strip()
+    if len(text) <= SHINGLE_SIZE:
+        return [text]
+    return list({text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)})
+
+def minhash_signature(message: str) -> bytes:
+    """MinHash signature of a message, packed as uint32s (MINHASH_PERMUTATIONS * 4 bytes)"""
+    import numpy as np
+
+    global _minhash_params
+    if _minhash_params is None:
+        rng = np.random.default_rng(20170201)
+        _minhash_params = (
+            rng.integers(1, 2 ** 32, MINHASH_PERMUTATIONS, dtype=np.uint64),
+            rng.integers(0, 2 ** 32, MINHASH_PERMUTATIONS, dtype=np.uint64),
+        )
+    a, b = _minhash_params
+
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in message_shingles(message)), dtype=np.uint64
+    )
+    # (a * x + b) mod p for every permutation/shingle pair; a * x < 2**64 so uint64 never overflows
+    permuted = ((np.outer(a, hashes) % _MERSENNE_PRIME) + b[:, None]) % _MERSENNE_PRIME
+    return (permuted.min(axis=1) & 0xFFFFFFFF).astype('<u4').tobytes()
+
+def lsh_buckets(signature: bytes) -> List[int]:
+    """One bucket key per LSH band; near-duplicates share at least one with high probability"""
+    band_size = len(signature) // LSH_BANDS
+    return [
+        (band << 32) | zlib.crc32(signature[band * band_size:(band + 1) * band_size])
+        for band in range(LSH_BANDS)
+    ]
+
+def signature_similarity(signature_a: bytes, signature_b: bytes) -> float:
+    """Estimated Jaccard similarity of two messages from their MinHash signatures"""
+    import numpy as np
+
+    return float(np.mean(np.frombuffer(signature_a, dtype='<u4') == np.frombuffer(signature_b, dtype='<u4')))
+
+def score_message(message: str) -> Dict:
+    """Ingest-time scoring: urgency, priority, category and near-duplicate signature"""
+    urgency_score, priority = calculate_urgency_score(message)
+    return {
+        'urgency_score': urgency_score,
+        'priority': priority,
+        'category': categorize_message(message),
+        'signature': minhash_signature(message),
+    }
+
 def extract_customer_info(message: str) -> Dict:
     """Extract potential customer information from message"""
     info = {}
@@ -101,42 +166,51 @@ def extract_customer_info(message: str) -> Dict:
     
     return info
 
-def filter_messages(messages_df: pd.DataFrame, 
+def filter_messages(messages,
                     search_query: str = "",
                     priority_filter: str = "all",
                     category_filter: str = "all",
                     status_filter: str = "all") -> pd.DataFrame:
-    """Filter messages based on various criteria"""
-    filtered_df = messages_df.copy()
-    
-    # Apply search filter
+    """Filter messages based on various criteria.
+
+    ``messages`` is either a DataFrame or a :class:`queue_engine.QueueSnapshot`;
+    snapshots are filtered on their bitmap indexes and only the matching rows
+    are materialised. A repository-backed snapshot holds unresolved messages only.
+    """
+    from queue_engine import QueueSnapshot
+
+    if isinstance(messages, QueueSnapshot):
+        from repository import QueueFilter
+        rows = messages.match(QueueFilter(
+            search_query=search_query, priority=priority_filter,
+            status=status_filter, category=category_filter
+        ))
+        return messages.to_frame(rows)
+
+    # Build one combined mask and index once instead of copying per filter
+    mask = None
+    for column, value in (('priority', priority_filter), ('category', category_filter), ('status', status_filter)):
+        if value != "all":
+            matches = messages[column] == value
+            mask = matches if mask is None else mask & matches
+
     if search_query:
-        mask = (
-            filtered_df['message_body'].str.contains(search_query, case=False, na=False) |
-            filtered_df['user_id'].astype(str).str.contains(search_query, case=False, na=False)
+        query = search_query.lower()
+        matches = (
+            messages['message_body'].str.lower().str.contains(query, regex=False, na=False) |
+            messages['user_id'].astype(str).str.contains(query, regex=False, na=False)
         )
-        filtered_df = filtered_df[mask]
-    
-    # Apply priority filter
-    if priority_filter != "all":
-        filtered_df = filtered_df[filtered_df['priority'] == priority_filter]
-    
-    # Apply category filter
-    if category_filter != "all":
-        filtered_df = filtered_df[filtered_df['category'] == category_filter]
-    
-    # Apply status filter
-    if status_filter != "all":
-        filtered_df = filtered_df[filtered_df['status'] == status_filter]
-    
-    return filtered_df
+        mask = matches if mask is None else mask & matches
+
+    return messages if mask is None else messages[mask]
 
 def format_timestamp(timestamp) -> str:
     """Format timestamp for display"""
-    if pd.isna(timestamp):
+    if timestamp is None or timestamp != timestamp:  # None, NaN or NaT
         return "N/A"
     
     if isinstance(timestamp, str):
+        import pandas as pd
         timestamp = pd.to_datetime(timestamp)
     
     now = datetime.now()